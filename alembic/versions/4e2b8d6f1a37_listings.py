@@ -0,0 +1,45 @@
+"""listings
+
+Revision ID: 4e2b8d6f1a37
+Revises: 7c1e9a4b2d10
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '4e2b8d6f1a37'
+down_revision: Union[str, Sequence[str], None] = '7c1e9a4b2d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'listings',
+        sa.Column('id', sa.UUID(as_uuid=False), nullable=False),
+        sa.Column('url', sa.String(length=1024), nullable=False),
+        sa.Column('source', sa.String(length=50), nullable=False),
+        sa.Column('city', sa.String(length=255), nullable=False),
+        sa.Column('deal_type', sa.String(length=20), nullable=False),
+        sa.Column('rooms', sa.Integer(), nullable=False),
+        sa.Column('area_total', sa.Float(), nullable=False),
+        sa.Column('price', sa.Float(), nullable=False),
+        sa.Column('address', sa.String(length=1024), nullable=False),
+        sa.Column('floor_info', sa.String(length=100), nullable=False),
+        sa.Column('first_seen_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('last_seen_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('url'),
+    )
+    op.create_index('ix_listings_segment', 'listings', ['city', 'deal_type', 'rooms', 'area_total'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_listings_segment', table_name='listings')
+    op.drop_table('listings')
@@ -0,0 +1,43 @@
+"""market segment stats
+
+Revision ID: 7c1e9a4b2d10
+Revises: 02bec7042a4f
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e9a4b2d10'
+down_revision: Union[str, Sequence[str], None] = '02bec7042a4f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'market_segment_stats',
+        sa.Column('id', sa.UUID(as_uuid=False), nullable=False),
+        sa.Column('city', sa.String(length=255), nullable=False),
+        sa.Column('deal_type', sa.String(length=20), nullable=False),
+        sa.Column('rooms', sa.Integer(), nullable=False),
+        sa.Column('area_bucket', sa.Integer(), nullable=False),
+        sa.Column('offers_count', sa.Integer(), nullable=False),
+        sa.Column('p25_price_m2', sa.Float(), nullable=True),
+        sa.Column('p50_price_m2', sa.Float(), nullable=True),
+        sa.Column('p75_price_m2', sa.Float(), nullable=True),
+        sa.Column('samples', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('city', 'deal_type', 'rooms', 'area_bucket', name='uq_market_segment_stats_segment'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('market_segment_stats')
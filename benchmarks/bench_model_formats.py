@@ -0,0 +1,113 @@
+"""
+Бенчмарк форматов моделей: время загрузки, первый прогноз и прирост RSS
+для joblib-pickle и нативного .cbm. Каждый замер — в отдельном процессе,
+как у нового uvicorn-воркера.
+
+    python -m benchmarks.bench_model_formats [--models-dir models] [--repeat 5]
+
+Если в папке нет моделей, используются синтетические (--iterations, --depth).
+"""
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from core.services.model_registry import (
+    WARMUP_INPUT, _load_artifact, discover_artifacts, latest_version, save_model_artifact
+)
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+
+def _rss_mb() -> float:
+    """Текущий RSS процесса (Linux), иначе пиковый"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(path: str, deal_type: str) -> dict:
+    """Замер в текущем процессе (запускается в дочернем)"""
+    import catboost  # noqa: F401 — библиотека нужна обоим форматам, в прирост не включаем
+    from predict_price import predict_ml_price
+
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    model = _load_artifact(Path(path))
+    load_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    predict_ml_price(WARMUP_INPUT, deal_type, model)
+    first_predict_s = time.perf_counter() - started
+
+    return {
+        'load_ms': load_s * 1000,
+        'first_predict_ms': first_predict_s * 1000,
+        'rss_delta_mb': _rss_mb() - rss_before,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _run_child(path: Path, deal_type: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_model_formats', '--child', str(path), deal_type],
+        cwd=BASE_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _artifacts(models_dir: Path, tmp_dir: Path, iterations: int, depth: int) -> dict:
+    """Пары (joblib, cbm) последней версии каждой модели; недостающий .cbm конвертируется"""
+    pairs = {}
+    found = discover_artifacts(str(models_dir))
+    for deal_type in ('sale', 'rent'):
+        versions = found.get(deal_type)
+        if versions:
+            path = versions[latest_version(versions)]
+            joblib_path = path.with_suffix('.joblib')
+            if joblib_path.exists():
+                model = _load_artifact(joblib_path)
+                cbm_path = save_model_artifact(model, deal_type, str(tmp_dir), version='bench', formats=('cbm',))
+                pairs[deal_type] = (joblib_path, cbm_path)
+                continue
+        from benchmarks.synthetic_models import make_synthetic_model
+        model = make_synthetic_model(deal_type, iterations=iterations, depth=depth)
+        cbm_path = save_model_artifact(model, deal_type, str(tmp_dir), version='bench', formats=('cbm', 'joblib'))
+        pairs[deal_type] = (cbm_path.with_suffix('.joblib'), cbm_path)
+    return pairs
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        print(json.dumps(measure(sys.argv[2], sys.argv[3])))
+        return
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models-dir', default=str(BASE_DIR / 'models'))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--depth', type=int, default=6)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pairs = _artifacts(Path(args.models_dir), Path(tmp), args.iterations, args.depth)
+        print(f"{'модель':<6} {'формат':<7} {'размер, МБ':>10} {'загрузка, мс':>13} "
+              f"{'1-й predict, мс':>16} {'+RSS, МБ':>9}")
+        for deal_type, paths in pairs.items():
+            for path in paths:
+                runs = [_run_child(path, deal_type) for _ in range(args.repeat)]
+                med = {k: statistics.median(r[k] for r in runs) for k in runs[0]}
+                print(f"{deal_type:<6} {path.suffix[1:]:<7} {path.stat().st_size / 2 ** 20:>10.2f} "
+                      f"{med['load_ms']:>13.1f} {med['first_predict_ms']:>16.1f} {med['rss_delta_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Бенчмарк разбора страниц выдачи CIAN: исходная версия парсера
+(html.parser + ~10 поисков с re.compile на каждую карточку), текущий
+DOM-разбор и извлечение из встроенного JSON-состояния.
+
+    python -m benchmarks.bench_parser [--repeat 20]
+"""
+import argparse
+import re
+import statistics
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from core.parsers import cian_parser
+from core.parsers.cian_parser import HTML_PARSER, parse_cian_html
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+
+def legacy_parse_cian_html(html, deal_type):
+    """Извлечение карточек в исходном виде — эталон для сравнения"""
+    soup = BeautifulSoup(html, "html.parser")
+
+    cards = soup.find_all("article", {"data-name": "CardComponent"})
+    if not cards and deal_type == "rent":
+        cards = soup.find_all("div", {"data-name": "OfferCard"})
+
+    analogs = []
+    for card in cards:
+        try:
+            if deal_type == 'sale':
+                price_elem = (card.find('span', {'data-mark': 'MainPrice'}) or
+                              card.find('span', class_=re.compile(r'price', re.I)))
+            else:
+                price_elem = (card.find('span', {'data-mark': 'MainPrice'}) or
+                              card.find('span', class_=re.compile(r'price|rent', re.I)) or
+                              card.find('p', class_=re.compile(r'price', re.I)))
+            if not price_elem:
+                continue
+
+            price_text = price_elem.get_text()
+            price_text_clean = re.sub(r'[^\d]', '', price_text.split('/')[0])
+            price = float(price_text_clean) if price_text_clean else 0
+            if price == 0:
+                continue
+
+            area_elem = card.find('div', string=re.compile(r'м²'))
+            if not area_elem:
+                area_elems = card.find_all('div', string=re.compile(r'(\d+[,.]?\d*)\s*м²'))
+                if area_elems:
+                    area_elem = area_elems[0]
+
+            area_val = None
+            if area_elem:
+                area_match = re.search(r'(\d+[,.]?\d*)\s*м²', area_elem.get_text())
+                if area_match:
+                    area_val = float(area_match.group(1).replace(',', '.'))
+
+            rooms_elem = card.find('div', string=re.compile(r'-комн|комнат|комн|Студия'))
+            rooms_val = None
+            if rooms_elem:
+                rooms_text = rooms_elem.get_text()
+                if 'студия' in rooms_text.lower() or 'studio' in rooms_text.lower():
+                    rooms_val = 0
+                else:
+                    rooms_match = re.search(r'(\d+)\s*[-]?комн', rooms_text)
+                    if rooms_match:
+                        rooms_val = int(rooms_match.group(1))
+
+            address_elem = card.find('div', {'data-name': 'AddressContainer'})
+            if not address_elem:
+                address_elem = card.find('a', {'data-name': 'Link'})
+            address = address_elem.get_text().strip() if address_elem else ''
+
+            link_elem = card.find('a', {'data-name': 'Link'})
+            if not link_elem:
+                link_elem = card.find('a', href=re.compile(r'cian.ru/rent/flat|cian.ru/sale/flat'))
+            url = link_elem['href'] if link_elem and link_elem.has_attr('href') else ''
+            if url and not url.startswith('http'):
+                url = 'https://www.cian.ru' + url
+
+            floor_elem = card.find('div', string=re.compile(r'этаж'))
+            floor_info = floor_elem.get_text().strip() if floor_elem else ''
+
+            if price > 0 and area_val and area_val > 10:
+                analogs.append({
+                    'price': price,
+                    'area_total': area_val,
+                    'rooms': rooms_val,
+                    'address': address,
+                    'url': url,
+                    'floor_info': floor_info,
+                    'deal_type': deal_type
+                })
+        except Exception:
+            continue
+    return analogs
+
+
+def dom_parse_cian_html(html, deal_type):
+    """Текущий DOM-разбор без попытки взять JSON-состояние"""
+    cards = cian_parser._ENGINE.cards(html, deal_type)
+    return cian_parser._collect_valid(cian_parser._safe_map(cian_parser._extract_card, cards, deal_type))
+
+
+def _timeit(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"Парсер дерева: {HTML_PARSER}")
+    print(f"{'fixture':<22}{'legacy, ms':>12}{'dom, ms':>10}{'json, ms':>10}{'dom x':>8}{'json x':>8}  parity")
+    for path in sorted(FIXTURES_DIR.glob("cian_*.html")):
+        html = path.read_text(encoding="utf-8")
+        deal_type = "rent" if "_rent_" in path.name else "sale"
+
+        legacy = legacy_parse_cian_html(html, deal_type)
+        dom = dom_parse_cian_html(html, deal_type)
+        current = parse_cian_html(html, deal_type)
+        parity = "ok" if legacy == dom == current else "MISMATCH"
+
+        legacy_ms = _timeit(lambda: legacy_parse_cian_html(html, deal_type), args.repeat)
+        dom_ms = _timeit(lambda: dom_parse_cian_html(html, deal_type), args.repeat)
+        json_ms = _timeit(lambda: parse_cian_html(html, deal_type), args.repeat)
+        print(f"{path.name:<22}{legacy_ms:>12.2f}{dom_ms:>10.2f}{json_ms:>10.2f}"
+              f"{legacy_ms / dom_ms:>7.1f}x{legacy_ms / json_ms:>7.1f}x  {parity}")
+
+
+if __name__ == "__main__":
+    main()
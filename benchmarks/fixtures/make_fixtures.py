@@ -0,0 +1,139 @@
+"""
+Генерирует детерминированные HTML-фикстуры страниц выдачи CIAN для бенчмарков.
+Разметка повторяет структуру карточек, на которую опирается парсер
+(CardComponent, MainPrice, AddressContainer, Link), шум реальной страницы
+и встроенное JSON-состояние window._cianConfig['frontend-serp'].
+
+    python -m benchmarks.fixtures.make_fixtures
+"""
+import json
+import random
+from pathlib import Path
+
+FIXTURES_DIR = Path(__file__).resolve().parent
+
+STREETS = ['Ленина', 'Пушкина', 'Гагарина', 'Мира', 'Советская', 'Садовая', 'Лесная', 'Школьная']
+
+
+def _noise(rng, depth=3):
+    # Вложенные блоки без полезных данных, как бейджи/галереи/кнопки в карточке
+    if depth == 0:
+        return f'<span class="_93444fe79c--color_gray60_100--{rng.randint(100, 999)}">{rng.choice(["Собственник", "Агент", "Проверено", "Новое"])}</span>'
+    return ''.join(
+        f'<div class="_93444fe79c--container--{rng.randint(1000, 9999)}">{_noise(rng, depth - 1)}</div>'
+        for _ in range(2)
+    )
+
+
+def make_offer(rng, i, deal_type):
+    rooms = rng.choice([0, 1, 1, 2, 2, 2, 3, 3, 4])
+    area = round(rng.uniform(18, 30) if rooms == 0 else rng.uniform(25 + rooms * 12, 45 + rooms * 20), 1)
+    if deal_type == 'sale':
+        price = int(area * rng.uniform(150_000, 380_000))
+    else:
+        price = int(area * rng.uniform(700, 1800))
+    levels = rng.randint(5, 25)
+    return {
+        'id': 300_000_000 + i,
+        'rooms': rooms,
+        'area': area,
+        'price': price,
+        'floor': rng.randint(1, levels),
+        'levels': levels,
+        'address': f'Москва, ул. {rng.choice(STREETS)}, {rng.randint(1, 120)}',
+    }
+
+
+def render_card(rng, offer, deal_type):
+    title = 'Студия' if offer['rooms'] == 0 else f"{offer['rooms']}-комн. кв."
+    price = f"{offer['price']:,}".replace(',', ' ')
+    suffix = ' ₽/мес.' if deal_type == 'rent' else ' ₽'
+    area = str(offer['area']).replace('.', ',')
+    url = f"https://www.cian.ru/{deal_type}/flat/{offer['id']}/"
+    return f'''
+<article data-name="CardComponent" class="_93444fe79c--container--Povoi _93444fe79c--cont--OzgVc">
+  <div data-name="LinkArea" class="_93444fe79c--linkArea--TqGpR">
+    <div data-name="Gallery">{''.join(f'<img src="https://images.cdn-cian.ru/images/{offer["id"]}-{k}.jpg" alt="">' for k in range(4))}</div>
+    <div class="_93444fe79c--general--BCXJ4">
+      {_noise(rng)}
+      <a data-name="Link" href="{url}" class="_93444fe79c--link--eoxce">
+        <span data-mark="OfferTitle"><span>{title}, {area} м², {offer['floor']}/{offer['levels']} этаж</span></span>
+      </a>
+      <div class="_93444fe79c--row--kEHOK"><div>{title}</div></div>
+      <div class="_93444fe79c--row--kEHOK"><div>{area} м²</div></div>
+      <div class="_93444fe79c--row--kEHOK"><div>{offer['floor']}/{offer['levels']} этаж</div></div>
+      <div data-name="SpecialGeo">{_noise(rng, 2)}</div>
+      <div data-name="AddressContainer" class="_93444fe79c--labels--L8WyJ">{offer['address']}</div>
+      <div data-name="ContentRow"><span data-mark="MainPrice"><span>{price}{suffix}</span></span></div>
+      <p class="_93444fe79c--price--description">{_noise(rng, 1)}</p>
+      {_noise(rng)}
+    </div>
+  </div>
+</article>'''
+
+
+def offer_state(offer, deal_type):
+    """Оффер в формате встроенного состояния выдачи"""
+    return {
+        'cianId': offer['id'],
+        'fullUrl': f"https://www.cian.ru/{deal_type}/flat/{offer['id']}/",
+        'flatType': 'studio' if offer['rooms'] == 0 else 'rooms',
+        'roomsCount': offer['rooms'] or None,
+        'totalArea': str(offer['area']),
+        'floorNumber': offer['floor'],
+        'building': {'floorsCount': offer['levels'], 'materialType': 'panel', 'buildYear': 1985},
+        'bargainTerms': {
+            'priceRur': offer['price'],
+            'currency': 'rur',
+            'paymentPeriod': 'monthly' if deal_type == 'rent' else None,
+        },
+        'geo': {'userInput': offer['address'], 'address': [{'fullName': part} for part in offer['address'].split(', ')]},
+        'photos': [{'fullUrl': f"https://images.cdn-cian.ru/images/{offer['id']}-{k}.jpg"} for k in range(4)],
+        'description': 'Продается квартира в хорошем состоянии. ' * 10,
+    }
+
+
+def render_state(offers, deal_type):
+    state = [
+        {'key': 'config', 'value': {'featureToggles': {f'toggle_{k}': bool(k % 2) for k in range(200)}}},
+        {'key': 'initialState', 'value': {
+            'filters': {'dealType': deal_type, 'offerType': 'flat'},
+            'results': {'offers': [offer_state(offer, deal_type) for offer in offers], 'totalOffers': 1234},
+        }},
+    ]
+    payload = json.dumps(state, ensure_ascii=False).replace('</', '<\\/')
+    return (
+        "<script>window._cianConfig = window._cianConfig || {};"
+        "window._cianConfig['frontend-serp'] = (window._cianConfig['frontend-serp'] || [])"
+        f".concat({payload});</script>"
+    )
+
+
+def render_page(deal_type, offers_count=28, seed=0, with_state=True):
+    rng = random.Random(f'{deal_type}-{seed}')
+    offers = [make_offer(rng, i, deal_type) for i in range(offers_count)]
+    cards = ''.join(render_card(rng, offer, deal_type) for offer in offers)
+    head_scripts = ''.join(
+        f'<script>window.__chunk_{k}=function(){{return "{"x" * 2000}"}};</script>' for k in range(20)
+    )
+    if with_state:
+        head_scripts += render_state(offers, deal_type)
+    header = ''.join(f'<div class="header-item"><a href="/link/{k}">Пункт меню {k}</a></div>' for k in range(150))
+    return (
+        '<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8"><title>Циан</title>'
+        f'<style>{".cls{color:red}" * 2000}</style>{head_scripts}</head><body>'
+        f'<header>{header}</header><main><div data-name="Offers">{cards}</div></main>'
+        f'<footer>{header}</footer></body></html>'
+    )
+
+
+def main():
+    for deal_type in ('sale', 'rent'):
+        for page in (1, 2, 3):
+            path = FIXTURES_DIR / f'cian_{deal_type}_p{page}.html'
+            path.write_text(render_page(deal_type, seed=page), encoding='utf-8')
+            print(f'{path.name}: {path.stat().st_size // 1024} KB')
+
+
+if __name__ == '__main__':
+    main()
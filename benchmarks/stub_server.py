@@ -0,0 +1,100 @@
+"""
+Локальный HTTP-сервер, отдающий фикстуры выдачи CIAN вместо www.cian.ru.
+Страница выбирается по deal_type и p из запроса /cat.php; страницы дальше
+последней фикстуры — пустая выдача (парсер на ней останавливается).
+
+    python -m benchmarks.stub_server [--port 8765] [--latency-ms 0]
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Tuple
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+EMPTY_PAGE = b"<html><head><title>CIAN</title></head><body><div data-name='Empty'></div></body></html>"
+
+
+def load_pages() -> Dict[Tuple[str, int], bytes]:
+    pages = {}
+    for path in FIXTURES_DIR.glob("cian_*_p*.html"):
+        _, deal_type, page = path.stem.split("_")
+        pages[(deal_type, int(page[1:]))] = path.read_bytes()
+    return pages
+
+
+class CianStubServer:
+    """Сервер в фоновом потоке: with CianStubServer() as stub: ... stub.base_url"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0):
+        pages = load_pages()
+        latency = latency_ms / 1000
+        stats = self.stats = {'requests': 0}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего сайта
+
+            def do_GET(self):
+                stats['requests'] += 1
+                url = urlparse(self.path)
+                if url.path != "/cat.php":
+                    self.send_error(404)
+                    return
+                query = parse_qs(url.query)
+                deal_type = query.get("deal_type", ["sale"])[0]
+                page = int(query.get("p", ["1"])[0])
+                body = pages.get((deal_type, page), EMPTY_PAGE)
+                if latency:
+                    time.sleep(latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "CianStubServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "CianStubServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with CianStubServer(port=args.port, latency_ms=args.latency_ms) as stub:
+        print(f"CIAN_BASE_URL={stub.base_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Синтетические модели CatBoost с теми же признаками, что у боевых:
+для бенчмарков без обучающих данных и артефактов из models/.
+"""
+import random
+from typing import Any, Dict, List
+
+from catboost import CatBoostRegressor
+
+from predict_price import prepare_rent_inputs, prepare_sale_inputs
+
+SALE_CAT_FEATURES = ['region_name', 'building_type', 'object_type', 'rooms']
+RENT_CAT_FEATURES = [
+    'type', 'gas', 'material', 'build_series_category', 'rubbish_chute',
+    'build_overlap', 'build_walls', 'heating', 'city'
+]
+
+REGIONS = ['Москва', 'Московская область', 'Санкт-Петербург', 'Свердловская область', 'Татарстан']
+CITIES = ['Москва', 'Химки', 'Санкт-Петербург', 'Екатеринбург', 'Казань']
+
+
+def synthetic_inputs(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Объекты в формате build_input_data из /api/predict"""
+    rnd = random.Random(seed)
+    items = []
+    for _ in range(n):
+        i = rnd.randrange(len(REGIONS))
+        levels = rnd.randint(2, 30)
+        area = round(rnd.uniform(18, 150), 1)
+        items.append({
+            'region': REGIONS[i],
+            'city': CITIES[i],
+            'building_type': str(rnd.randint(0, 5)),
+            'object_type': str(rnd.randint(1, 2)),
+            'level': rnd.randint(1, levels),
+            'levels': levels,
+            'rooms': rnd.randint(0, 4),
+            'area': area,
+            'kitchen_area': round(area * 0.2, 1),
+            'deal_type': 'sale',
+        })
+    return items
+
+
+def make_synthetic_model(deal_type: str, iterations: int = 50, depth: int = 4, seed: int = 0) -> CatBoostRegressor:
+    """Модель на случайной выборке: цены правдоподобные, точность не важна"""
+    items = synthetic_inputs(500, seed)
+    rnd = random.Random(seed + 1)
+    if deal_type == 'sale':
+        X = prepare_sale_inputs(items)
+        # Боевая модель продажи отдает цену без обратного логарифма
+        y = [item['area'] * rnd.uniform(150000, 350000) for item in items]
+        cat_features = SALE_CAT_FEATURES
+    else:
+        X = prepare_rent_inputs(items)
+        y = [rnd.uniform(10.0, 11.5) for _ in items]
+        cat_features = RENT_CAT_FEATURES
+
+    model = CatBoostRegressor(
+        iterations=iterations,
+        depth=depth,
+        cat_features=cat_features,
+        random_seed=seed,
+        verbose=0,
+        thread_count=1,
+        allow_writing_files=False,
+    )
+    model.fit(X, y)
+    return model
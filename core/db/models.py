@@ -5,9 +5,12 @@ from typing import Optional, Dict, Any, List
 
 from sqlalchemy import (
     DateTime,
+    Float,
     ForeignKey,
+    Index,
     String,
     Integer,
+    UniqueConstraint,
     func
 )
 from sqlalchemy.dialects.postgresql import UUID, JSONB
@@ -66,4 +69,50 @@ class MarketSnapshot(Base):
     source: Mapped[str] = mapped_column(String(100), nullable=False)
     snapshot: Mapped[Dict[str, Any]] = mapped_column(JSONB, nullable=False)
 
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
\ No newline at end of file
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class MarketSegmentStats(Base):
+    """Агрегированная статистика цен за м² по сегменту рынка"""
+    __tablename__ = "market_segment_stats"
+    __table_args__ = (
+        UniqueConstraint("city", "deal_type", "rooms", "area_bucket", name="uq_market_segment_stats_segment"),
+    )
+
+    id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True)
+    city: Mapped[str] = mapped_column(String(255), nullable=False)
+    deal_type: Mapped[str] = mapped_column(String(20), nullable=False)
+    rooms: Mapped[int] = mapped_column(Integer, nullable=False)
+    area_bucket: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    offers_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    p25_price_m2: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    p50_price_m2: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    p75_price_m2: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    # Окно последних наблюдений {url: [цена за м², unix time]} для инкрементального пересчета
+    samples: Mapped[Dict[str, Any]] = mapped_column(JSONB, nullable=False, default=dict)
+
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False
+    )
+
+class Listing(Base):
+    """Объявление, увиденное при скрейпе; одна строка на ссылку"""
+    __tablename__ = "listings"
+    __table_args__ = (
+        Index("ix_listings_segment", "city", "deal_type", "rooms", "area_total"),
+    )
+
+    id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True)
+    url: Mapped[str] = mapped_column(String(1024), nullable=False, unique=True)
+    source: Mapped[str] = mapped_column(String(50), nullable=False, default="cian")
+    city: Mapped[str] = mapped_column(String(255), nullable=False)
+    deal_type: Mapped[str] = mapped_column(String(20), nullable=False)
+    rooms: Mapped[int] = mapped_column(Integer, nullable=False)
+    area_total: Mapped[float] = mapped_column(Float, nullable=False)
+    price: Mapped[float] = mapped_column(Float, nullable=False)
+    address: Mapped[str] = mapped_column(String(1024), nullable=False, default="")
+    floor_info: Mapped[str] = mapped_column(String(100), nullable=False, default="")
+
+    first_seen_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_seen_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -1,11 +1,264 @@
-from core.parsers.cian_parser import get_cian_analogs
-
-def get_analogs(city: str, deal_type: str, rooms: int, area: float):
-    return get_cian_analogs(
-        location=city,
-        deal_type=deal_type,
-        rooms=rooms,
-        area=area,
-        start_page=1,
-        end_page=1,
-    )
\ No newline at end of file
+import asyncio
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+from core.parsers.cian_parser import analogs_limit, fetch_cian_listings, select_cian_analogs
+from core.services.analog_cache import analog_cache, area_bucket, bucket_bounds
+from core.services.listing_store import listing_store
+from core.services.market_snapshots import read_snapshot, register_segment, segment_rooms
+from core.services.metrics import count_source_outcome
+
+logger = logging.getLogger(__name__)
+
+# Источники аналогов через запятую; пусто — все зарегистрированные
+ANALOG_SOURCES = [s.strip() for s in os.getenv("ANALOG_SOURCES", "").split(",") if s.strip()]
+# Сколько ждать один источник; не успевший дорабатывает в фоне и заполняет свой кэш
+ANALOG_SOURCE_TIMEOUT = float(os.getenv("ANALOG_SOURCE_TIMEOUT", "10"))  # секунды
+# То же для локальных источников (хранилище объявлений, файл): они отвечают быстро или не отвечают
+ANALOG_LOCAL_SOURCE_TIMEOUT = float(os.getenv("ANALOG_LOCAL_SOURCE_TIMEOUT", "0.5"))  # секунды
+# Файл с объявлениями для локального источника (JSON-список в формате аналогов CIAN)
+ANALOG_FILE_PATH = os.getenv("ANALOG_FILE_PATH")
+
+# Загрузки, которые дорабатывают без ожидающего запроса: ссылки держим до завершения
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def finish_in_background(task: asyncio.Task) -> None:
+    """Загрузка дорабатывает без ожидающего запроса и заполняет кэш для следующих"""
+    if task.done():
+        return
+    _background_tasks.add(task)
+    task.add_done_callback(_background_done)
+
+
+def _background_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Фоновая загрузка аналогов завершилась ошибкой", exc_info=task.exception())
+
+
+class AnalogSource(ABC):
+    """
+    Источник объявлений для аналогов. fetch возвращает сырые объявления сегмента
+    (формат analog_data из cian_parser), ранжирование общее для всех источников.
+    Локальные (local=True) опрашиваются вместе с сетевыми: если их хватает,
+    сетевые загрузки отменяются
+    """
+
+    name = "base"
+    timeout = ANALOG_SOURCE_TIMEOUT
+    local = False
+
+    @abstractmethod
+    async def fetch(self, city: str, deal_type: str, rooms: int, area: float, live: bool = True) -> List[Dict[str, Any]]:
+        """Сырые объявления сегмента; live=False — без похода в сеть"""
+
+
+class CianSource(AnalogSource):
+    """CIAN: снапшот сегмента, иначе живой скрейп через кэш аналогов"""
+
+    name = "cian"
+
+    async def fetch(self, city: str, deal_type: str, rooms: int, area: float, live: bool = True) -> List[Dict[str, Any]]:
+        # Сначала свежий снапшот сегмента от фонового обновления — без похода в сеть
+        listings = await read_snapshot(city, deal_type, rooms)
+        if listings is not None:
+            return listings
+        if not live:
+            return []
+
+        # Снапшота нет: живой скрейп через кэш, а сегмент отдаем на фоновое обновление
+        await register_segment(city, deal_type, rooms)
+
+        # Запрос к CIAN строится по всей корзине площади, чтобы кэшированный
+        # результат подходил для любой площади из этой корзины
+        lo, hi = bucket_bounds(area_bucket(area))
+
+        async def load() -> List[Dict[str, Any]]:
+            listings = await fetch_cian_listings(
+                location=city,
+                deal_type=deal_type,
+                rooms=rooms,
+                min_area=max(lo * 0.7, 20),
+                max_area=hi * 1.2,
+                start_page=1,
+                end_page=1,
+            )
+            # Скрейпленное сохраняем в хранилище объявлений, ответ запись не ждет
+            finish_in_background(asyncio.ensure_future(listing_store.save(city, deal_type, listings, self.name)))
+            return listings
+
+        return await analog_cache.get_or_load(analog_cache.make_key(city, deal_type, rooms, area), load)
+
+
+class ListingStoreSource(AnalogSource):
+    """Ранее скрейпленные объявления из Postgres: ближайшие соседи по индексу города в памяти"""
+
+    name = "store"
+    timeout = ANALOG_LOCAL_SOURCE_TIMEOUT
+    local = True
+
+    async def fetch(self, city: str, deal_type: str, rooms: int, area: float, live: bool = True) -> List[Dict[str, Any]]:
+        return await listing_store.nearest(city, deal_type, rooms, area)
+
+
+class FileSource(AnalogSource):
+    """Объявления из локального JSON-файла (тесты, офлайн-стенды). Перечитывается при изменении"""
+
+    name = "file"
+    timeout = ANALOG_LOCAL_SOURCE_TIMEOUT
+    local = True
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._mtime: Optional[float] = None
+        self._index: Dict[Tuple[str, str, int], List[Dict[str, Any]]] = {}
+
+    def _load(self) -> None:
+        mtime = self.path.stat().st_mtime
+        if mtime == self._mtime:
+            return
+        data = json.loads(self.path.read_text(encoding='utf-8'))
+        listings = data['listings'] if isinstance(data, dict) else data
+        index: Dict[Tuple[str, str, int], List[Dict[str, Any]]] = {}
+        for flat in listings:
+            if flat.get('rooms') is None or not flat.get('city'):
+                continue
+            key = (flat['city'].strip().casefold(), flat.get('deal_type', 'sale'), segment_rooms(flat['rooms']))
+            index.setdefault(key, []).append(flat)
+        self._index, self._mtime = index, mtime
+        logger.info("Локальный источник аналогов %s: %s объявлений", self.path, len(listings))
+
+    async def fetch(self, city: str, deal_type: str, rooms: int, area: float, live: bool = True) -> List[Dict[str, Any]]:
+        await asyncio.to_thread(self._load)
+        return self._index.get((city.strip().casefold(), deal_type, segment_rooms(rooms)), [])
+
+
+_sources: Dict[str, AnalogSource] = {}
+
+
+def register_source(source: AnalogSource) -> None:
+    """Добавляет источник (или заменяет источник с тем же именем)"""
+    _sources[source.name] = source
+
+
+def unregister_source(name: str) -> None:
+    _sources.pop(name, None)
+
+
+def active_sources() -> List[AnalogSource]:
+    if not ANALOG_SOURCES:
+        return list(_sources.values())
+    return [_sources[name] for name in ANALOG_SOURCES if name in _sources]
+
+
+register_source(CianSource())
+if listing_store.enabled:
+    register_source(ListingStoreSource())
+if ANALOG_FILE_PATH:
+    register_source(FileSource(ANALOG_FILE_PATH))
+
+
+def listing_key(flat: Dict[str, Any]) -> Hashable:
+    """Ключ дедупликации: ссылка без параметров, иначе адрес с площадью и комнатами"""
+    url = (flat.get('url') or '').split('?', 1)[0].rstrip('/')
+    if url:
+        return url
+    return (' '.join((flat.get('address') or '').casefold().split()), flat.get('area_total'), flat.get('rooms'))
+
+
+async def _query_source(
+        source: AnalogSource,
+        city: str,
+        deal_type: str,
+        rooms: int,
+        area: float,
+        live: bool
+) -> List[Dict[str, Any]]:
+    started = time.perf_counter()
+    task = asyncio.ensure_future(source.fetch(city, deal_type, rooms, area, live))
+    try:
+        # shield: по таймауту перестаем ждать, но загрузка продолжается и заполнит кэш источника
+        listings = await asyncio.wait_for(asyncio.shield(task), source.timeout)
+    except asyncio.TimeoutError:
+        finish_in_background(task)
+        count_source_outcome(source.name, 'timeout')
+        logger.info("Источник аналогов %s не ответил за %.1f с", source.name, source.timeout)
+        return []
+    except asyncio.CancelledError:
+        # Аналогов уже хватает (или запрос отменен): загрузку источника не доводим
+        task.cancel()
+        raise
+    except Exception:
+        count_source_outcome(source.name, 'error')
+        logger.warning("Ошибка источника аналогов %s", source.name, exc_info=True)
+        return []
+    count_source_outcome(source.name, 'ok' if listings else 'empty')
+    logger.debug("Источник %s: %s объявлений за %.3f с", source.name, len(listings), time.perf_counter() - started)
+    return listings
+
+
+async def _gather_analogs(
+        sources: List[AnalogSource],
+        merged: Dict[Hashable, Dict[str, Any]],
+        city: str,
+        deal_type: str,
+        rooms: int,
+        area: float,
+        live: bool
+) -> List[Dict[str, Any]]:
+    """Опрашивает источники одновременно, дополняет merged и возвращает ранжированные аналоги"""
+    pending = {
+        asyncio.ensure_future(_query_source(source, city, deal_type, rooms, area, live))
+        for source in sources
+    }
+    selected = select_cian_analogs(list(merged.values()), city, deal_type, rooms, area)
+    try:
+        while pending and len(selected) < analogs_limit(deal_type):
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            added = False
+            for task in done:
+                for flat in task.result():
+                    key = listing_key(flat)
+                    if key not in merged:
+                        merged[key] = flat
+                        added = True
+            if added:
+                selected = select_cian_analogs(list(merged.values()), city, deal_type, rooms, area)
+    finally:
+        # Аналогов хватает: оставшиеся загрузки отменяем
+        for task in pending:
+            task.cancel()
+    return selected
+
+
+async def get_analogs(city: str, deal_type: str, rooms: int, area: float, live: bool = True):
+    """
+    Опрашивает все источники одновременно, локальные запускаются первыми.
+    Объявления объединяются без дублей и ранжируются; результат возвращается,
+    как только аналогов достаточно (остальные загрузки отменяются) или все
+    источники ответили (либо истек их таймаут)
+    """
+    sources = sorted(active_sources(), key=lambda source: not source.local)
+    return await _gather_analogs(sources, {}, city, deal_type, rooms, area, live)
+
+
+def get_stale_analogs(city: str, deal_type: str, rooms: int, area: float):
+    """Аналоги из кэша в памяти, даже истекшего, — когда на живой поиск не осталось времени"""
+    listings = analog_cache.get_stale(analog_cache.make_key(city, deal_type, rooms, area))
+    if not listings:
+        return []
+    return select_cian_analogs(listings, city, deal_type, rooms, area)
+
+
+def sources_stats() -> Dict[str, Any]:
+    return {
+        'active': [source.name for source in active_sources()],
+        'registered': list(_sources),
+        'background': len(_background_tasks),
+    }
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+# Снапшот из репозитория: только читается, пока нет обновленного
+CIAN_LOCATIONS_SEED = os.getenv("CIAN_LOCATIONS_SEED", str(BASE_DIR / "config" / "cian_locations.json"))
+# Обновленный из библиотеки снапшот (вне git)
+CIAN_LOCATIONS_SNAPSHOT = os.getenv("CIAN_LOCATIONS_SNAPSHOT", str(BASE_DIR / "var" / "cian_locations.json"))
+CIAN_LOCATIONS_REFRESH = int(os.getenv("CIAN_LOCATIONS_REFRESH", "86400"))  # секунды
+
+
+def normalize_city_name(name: str) -> str:
+    return name.strip().casefold().replace('ё', 'е')
+
+
+class CianLocationIndex:
+    """
+    Индекс город -> ID региона CIAN со снапшотом на диске. В API индекс обновляется
+    из библиотеки в фоне (start_watching), запросы в это время видят текущий
+    """
+
+    def __init__(self, snapshot_path: str, seed_path: str, refresh_interval: int):
+        self.snapshot_path = Path(snapshot_path)
+        self.seed_path = Path(seed_path)
+        self.refresh_interval = refresh_interval
+        self._index: Optional[Dict[str, str]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _build_index(locations: List) -> Dict[str, str]:
+        index = {}
+        for loc in locations:
+            if isinstance(loc, (list, tuple)) and len(loc) >= 2:
+                # При дублях побеждает первое вхождение, как при линейном поиске
+                index.setdefault(normalize_city_name(loc[0]), loc[1])
+        return index
+
+    def _load_snapshot(self) -> Optional[List]:
+        for path in (self.snapshot_path, self.seed_path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                continue
+            except json.JSONDecodeError:
+                logger.warning("Ошибка JSON в снапшоте локаций %s", path)
+        return None
+
+    def _write_snapshot(self, locations: List) -> None:
+        tmp_path = self.snapshot_path.with_suffix('.tmp')
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump([list(loc) for loc in locations], f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError:
+            logger.warning("Не удалось сохранить снапшот локаций %s", self.snapshot_path, exc_info=True)
+
+    def _refresh_from_library(self) -> bool:
+        try:
+            # Импорт тяжелый и нужен только здесь: при свежем снапшоте библиотека не грузится
+            import cianparser
+            locations = list(cianparser.list_locations())
+        except Exception:
+            logger.warning("cianparser.list_locations() недоступен", exc_info=True)
+            return False
+        index = self._build_index(locations)
+        if index != self._index:
+            self._write_snapshot(locations)
+        self._index = index
+        return True
+
+    def refresh(self) -> None:
+        """Обновление из библиотеки (блокирующее); при ошибке остается текущий индекс"""
+        self._ensure_loaded()
+        self._refresh_from_library()
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self) -> Dict[str, str]:
+        index = self._index
+        if index is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+            return index
+
+        with self._lock:
+            if self._index is None:
+                # Холодный старт: сначала снапшот, библиотека — только если его нет
+                snapshot = self._load_snapshot()
+                if snapshot is not None:
+                    self._index = self._build_index(snapshot)
+                else:
+                    self._refresh_from_library()
+            elif self._watch_task is None and time.monotonic() - self._loaded_at >= self.refresh_interval:
+                # Без фонового обновления (воркеры Celery) — при обращении, как раньше
+                self._refresh_from_library()
+            self._loaded_at = time.monotonic()
+            if self._index is None:
+                self._index = {}
+            return self._index
+
+    def get_city_id(self, city_name: str) -> Optional[str]:
+        """ID города в CIAN или None"""
+        if not city_name:
+            return None
+        return self._ensure_loaded().get(normalize_city_name(city_name))
+
+    def __len__(self) -> int:
+        return len(self._ensure_loaded())
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                logger.warning("Не удалось обновить локации CIAN", exc_info=True)
+
+    def start_watching(self) -> None:
+        if self.refresh_interval > 0 and self._watch_task is None:
+            self._watch_task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop_watching(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+
+cian_locations = CianLocationIndex(CIAN_LOCATIONS_SNAPSHOT, CIAN_LOCATIONS_SEED, CIAN_LOCATIONS_REFRESH)
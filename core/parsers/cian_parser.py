@@ -1,14 +1,33 @@
-import requests
-from typing import List, Dict, Any
-import json
+import asyncio
+import os
+from typing import List, Dict, Any, Optional, Tuple
 import re
-import time
-from bs4 import BeautifulSoup
-import cianparser
+from bs4 import BeautifulSoup, SoupStrainer, Tag
 import logging
 
+from core.parsers.cian_locations import cian_locations
+from core.parsers.http_client import get_http_client
+from core.services.analog_batch import AnalogBatch
+from core.services.cian_guard import cian_guard
+from core.services.city_region_mapper import city_regions
+from core.services.executor import compute_executor
+from core.services.metrics import count_cian_outcome, stage_timer
+
 logger = logging.getLogger(__name__)
 
+# Адрес CIAN; бенчмарки подменяют его локальным сервером с фикстурами
+CIAN_BASE_URL = os.getenv("CIAN_BASE_URL", "https://www.cian.ru").rstrip('/')
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
 DEFAULT_HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
@@ -38,211 +57,397 @@ def _looks_like_captcha(html: str) -> bool:
     return any(m in low for m in _CAPTCHA_MARKERS)
 
 
-# Загружаем маппинг город->регион
-def load_region_mapping(mapping_path='regions.json'):
-    """Загружает маппинг регионов и городов"""
-    try:
-        with open(mapping_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        logger.warning("Файл %s не найден", mapping_path)
-        return {}
-    except json.JSONDecodeError:
-        logger.warning("Ошибка JSON в файле %s", mapping_path)
-        return {}
-
-
-# Создаем обратный маппинг город->регион
-def create_city_to_region_mapping(region_data):
-    """Создает маппинг город -> регион"""
-    city_to_region = {}
-    for region, cities in region_data.items():
-        for city in cities:
-            city_to_region[city.lower()] = region
-    return city_to_region
-
-# Загружаем данные при импорте
-region_data = load_region_mapping()
-city_to_region_mapping = create_city_to_region_mapping(region_data)
-
 def get_region_from_city(city_name):
     """Определяет регион по названию города"""
     if not city_name:
         return "Неизвестный регион"
-    return city_to_region_mapping.get(city_name.lower(), "Неизвестный регион")
+    return city_regions.current.get_region_from_city(city_name)
 
 
-def get_city_id(city_name, valid_locations):
-    """Получает ID города из списка cianparser"""
-    for loc in valid_locations:
-        if isinstance(loc, list) and len(loc) >= 2 and loc[0].lower() == city_name.lower():
-            return loc[1]  # Возвращаем ID
-    return None
+def get_city_id(city_name):
+    """Получает ID города из индекса локаций cianparser"""
+    return cian_locations.get_city_id(city_name)
+
+_STATUS_OUTCOMES = {403: 'forbidden', 429: 'rate_limited'}
+
 
-def parse_cian_page(url, params, DEFAULT_HEADERS, deal_type):
-    """Парсит одну страницу CIAN с учетом типа сделки"""
+async def _load_cian_page(url, params, headers, deal_type) -> Tuple[str, List[Dict[str, Any]]]:
     try:
-        response = requests.get(url, params=params, headers=DEFAULT_HEADERS, timeout=15)
-        if response.url and "captcha" in response.url.lower():
+        with stage_timer('cian_fetch'):
+            response = await get_http_client().get(url, params=params, headers=headers)
+        if response.url and "captcha" in str(response.url).lower():
             logger.warning("Циан редирект на капчу url=%s", response.url)
-            return []
+            return 'captcha', []
 
         # Fail-safe: редиректы/403/429/5xx — сразу считаем, что аналогов нет
         if response.status_code in (403, 429) or response.status_code >= 500:
             logger.warning("Циан статус=%s for %s params=%s", response.status_code, url, params)
-            return []
+            return _STATUS_OUTCOMES.get(response.status_code, 'server_error'), []
 
         response.raise_for_status()
 
         html = response.text or ""
         if _looks_like_captcha(html):
             logger.warning("Циан Выглядит как капча/блок для %s params=%s", url, params)
-            return []
+            return 'captcha', []
+
+        # Разбор HTML занимает CPU — выполняем вне event loop (поток или процесс)
+        analogs = await compute_executor.parse_html(html, deal_type, url, params)
+        return ('ok' if analogs else 'empty'), analogs
+
+    except Exception:
+        logger.warning("Ошибка парсинга страницы url=%s params=%s", url, params, exc_info=True)
+        return 'error', []
 
-        soup = BeautifulSoup(html, "html.parser")
 
+async def fetch_cian_page(url, params, headers, deal_type) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Загружает и парсит одну страницу CIAN через ограничитель частоты и размыкатель цепи.
+    Возвращает (исход, аналоги); при заблокированном источнике в сеть не идет
+    """
+    permit = await cian_guard.acquire()
+    if permit not in ('ok', 'probe'):
+        count_cian_outcome(permit)
+        return permit, []
+    outcome, analogs = await _load_cian_page(url, params, headers, deal_type)
+    count_cian_outcome(outcome)
+    await cian_guard.report(outcome, probe=permit == 'probe')
+    return outcome, analogs
+
+
+async def parse_cian_page(url, params, DEFAULT_HEADERS, deal_type):
+    """Загружает и парсит одну страницу CIAN с учетом типа сделки"""
+    _, analogs = await fetch_cian_page(url, params, DEFAULT_HEADERS, deal_type)
+    return analogs
+
+
+# Предкомпилированные шаблоны разбора карточек
+_PRICE_CLASS_RE = re.compile(r'price', re.I)
+_RENT_PRICE_CLASS_RE = re.compile(r'price|rent', re.I)
+_AREA_RE = re.compile(r'(\d+[,.]?\d*)\s*м²')
+_ROOMS_LABEL_RE = re.compile(r'-комн|комнат|комн|Студия')
+_ROOMS_NUM_RE = re.compile(r'(\d+)\s*[-]?комн')
+_FLOOR_RE = re.compile(r'этаж')
+_OFFER_HREF_RE = re.compile(r'cian.ru/rent/flat|cian.ru/sale/flat')
+_NON_DIGIT_RE = re.compile(r'[^\d]')
+
+
+class _LxmlEngine:
+    """Разбор на lxml: дерево строится в C, карточки ищутся XPath"""
+    name = "lxml"
+
+    @staticmethod
+    def cards(html, deal_type):
+        root = lxml.html.document_fromstring(html)
+        cards = root.xpath('//article[@data-name="CardComponent"]')
+        if not cards and deal_type == "rent":
+            cards = root.xpath('//div[@data-name="OfferCard"]')
+        return cards
+
+    @staticmethod
+    def descendants(card):
+        for el in card.iterdescendants():
+            # Комментарии и processing instructions пропускаем
+            if isinstance(el.tag, str):
+                yield el.tag, el
+
+    @staticmethod
+    def attr(el, key):
+        return el.get(key)
+
+    @staticmethod
+    def string(el):
+        """Аналог BeautifulSoup .string: текст единственного потомка, иначе None"""
+        while True:
+            if len(el) == 0:
+                return el.text
+            if len(el) > 1 or el.text or el[0].tail or not isinstance(el[0].tag, str):
+                return None
+            el = el[0]
+
+    @staticmethod
+    def text(el):
+        return el.text_content()
+
+
+class _SoupEngine:
+    """Запасной вариант на BeautifulSoup, дерево строится только для карточек"""
+    name = "html.parser"
+    _strainer = SoupStrainer(['article', 'div'], attrs={'data-name': ['CardComponent', 'OfferCard']})
+
+    @classmethod
+    def cards(cls, html, deal_type):
+        soup = BeautifulSoup(html, "html.parser", parse_only=cls._strainer)
         cards = soup.find_all("article", {"data-name": "CardComponent"})
         if not cards and deal_type == "rent":
             cards = soup.find_all("div", {"data-name": "OfferCard"})
+        return cards
+
+    @staticmethod
+    def descendants(card):
+        for tag in card.descendants:
+            if isinstance(tag, Tag):
+                yield tag.name, tag
+
+    @staticmethod
+    def attr(tag, key):
+        value = tag.get(key)
+        return ' '.join(value) if isinstance(value, list) else value
+
+    @staticmethod
+    def string(tag):
+        return tag.string
+
+    @staticmethod
+    def text(tag):
+        return tag.get_text()
+
+
+_ENGINE = _LxmlEngine if lxml is not None else _SoupEngine
+HTML_PARSER = _ENGINE.name
+
+
+def _extract_card(card, deal_type, engine=_ENGINE):
+    """
+    Один проход по потомкам карточки. Для каждого поля запоминается первый
+    подходящий элемент с тем же приоритетом селекторов, что и раньше
+    """
+    price_main = price_cls = price_p = None
+    area_elem = rooms_elem = floor_elem = None
+    address_elem = link_elem = href_elem = None
+    price_cls_re = _PRICE_CLASS_RE if deal_type == 'sale' else _RENT_PRICE_CLASS_RE
+    attr = engine.attr
+
+    for name, el in engine.descendants(card):
+        if name == 'span':
+            if price_main is None and attr(el, 'data-mark') == 'MainPrice':
+                price_main = el
+            elif price_cls is None and price_cls_re.search(attr(el, 'class') or ''):
+                price_cls = el
+        elif name == 'div':
+            if address_elem is None and attr(el, 'data-name') == 'AddressContainer':
+                address_elem = el
+            text = engine.string(el)
+            if text is not None:
+                if area_elem is None and 'м²' in text:
+                    area_elem = el
+                if rooms_elem is None and _ROOMS_LABEL_RE.search(text):
+                    rooms_elem = el
+                if floor_elem is None and _FLOOR_RE.search(text):
+                    floor_elem = el
+        elif name == 'a':
+            if link_elem is None and attr(el, 'data-name') == 'Link':
+                link_elem = el
+            elif href_elem is None and _OFFER_HREF_RE.search(attr(el, 'href') or ''):
+                href_elem = el
+        elif name == 'p':
+            if price_p is None and deal_type != 'sale' and _PRICE_CLASS_RE.search(attr(el, 'class') or ''):
+                price_p = el
+
+        # Все основные поля найдены — дальше идти незачем
+        if (price_main is not None and area_elem is not None and rooms_elem is not None
+                and floor_elem is not None and address_elem is not None and link_elem is not None):
+            break
+
+    price_elem = price_main if price_main is not None else (price_cls if price_cls is not None else price_p)
+    if price_elem is None:
+        return None
+
+    # Очищаем цену и учитываем, что аренда может быть в руб/мес (берем часть до "/")
+    price_text_clean = _NON_DIGIT_RE.sub('', engine.text(price_elem).split('/')[0])
+    price = float(price_text_clean) if price_text_clean else 0
+    if price == 0:
+        return None
+
+    area_val = None
+    if area_elem is not None:
+        area_match = _AREA_RE.search(engine.text(area_elem))
+        if area_match:
+            area_val = float(area_match.group(1).replace(',', '.'))
+
+    rooms_val = None
+    if rooms_elem is not None:
+        rooms_text = engine.text(rooms_elem)
+        # Обработка студий
+        rooms_low = rooms_text.lower()
+        if 'студия' in rooms_low or 'studio' in rooms_low:
+            rooms_val = 0
+        else:
+            rooms_match = _ROOMS_NUM_RE.search(rooms_text)
+            if rooms_match:
+                rooms_val = int(rooms_match.group(1))
+
+    # Иногда адрес только в ссылке
+    address_src = address_elem if address_elem is not None else link_elem
+    address = engine.text(address_src).strip() if address_src is not None else ''
+
+    offer_link = link_elem if link_elem is not None else href_elem
+    offer_url = (attr(offer_link, 'href') or '') if offer_link is not None else ''
+    if offer_url and not offer_url.startswith('http'):
+        offer_url = 'https://www.cian.ru' + offer_url
+
+    floor_info = engine.text(floor_elem).strip() if floor_elem is not None else ''
+
+    return {
+        'price': price,
+        'area_total': area_val,
+        'rooms': rooms_val,
+        'address': address,
+        'url': offer_url,
+        'floor_info': floor_info,
+        'deal_type': deal_type
+    }
+
+
+# Встроенное состояние страницы: window._cianConfig['frontend-serp'] = (...).concat([...]);
+_STATE_MARKER = "_cianConfig['frontend-serp']"
+_STATE_CONCAT = ".concat("
+
+
+def _extract_embedded_offers(html):
+    """Список офферов из встроенного JSON-состояния или None, если его нет"""
+    marker = html.find(_STATE_MARKER)
+    if marker == -1:
+        return None
+    concat = html.find(_STATE_CONCAT, marker)
+    script_end = html.find("</script>", marker)
+    if concat == -1 or script_end == -1 or concat > script_end:
+        return None
+
+    # Внутри <script> JSON не может содержать "</script>", поэтому конец массива —
+    # последняя ")" перед закрывающим тегом
+    payload = html[concat + len(_STATE_CONCAT):html.rfind(")", concat, script_end)]
+    for item in _json_loads(payload):
+        if isinstance(item, dict) and item.get('key') == 'initialState':
+            return ((item.get('value') or {}).get('results') or {}).get('offers')
+    return None
+
+
+def _offer_to_analog(offer, deal_type):
+    """Оффер из JSON-состояния в формате analog_data"""
+    terms = offer.get('bargainTerms') or {}
+    price = terms.get('priceRur') or terms.get('price')
+    price = float(price) if price else 0
+    if price == 0:
+        return None
+
+    area_val = float(offer['totalArea']) if offer.get('totalArea') else None
+
+    if offer.get('flatType') == 'studio':
+        rooms_val = 0
+    else:
+        rooms_val = int(offer['roomsCount']) if offer.get('roomsCount') is not None else None
+
+    geo = offer.get('geo') or {}
+    address = geo.get('userInput') or ', '.join(
+        part.get('fullName') or part.get('title') or '' for part in geo.get('address') or []
+    )
+
+    floor = offer.get('floorNumber')
+    floors_count = (offer.get('building') or {}).get('floorsCount')
+    if floor is not None and floors_count:
+        floor_info = f"{floor}/{floors_count} этаж"
+    elif floor is not None:
+        floor_info = f"{floor} этаж"
+    else:
+        floor_info = ''
+
+    return {
+        'price': price,
+        'area_total': area_val,
+        'rooms': rooms_val,
+        'address': address.strip(),
+        'url': offer.get('fullUrl') or '',
+        'floor_info': floor_info,
+        'deal_type': deal_type
+    }
+
+
+def _collect_valid(candidates):
+    analogs = []
+    for analog_data in candidates:
+        # Валидация минимальных требований: минимальная площадь 10 м²
+        if analog_data and analog_data['area_total'] and analog_data['area_total'] > 10:
+            analogs.append(analog_data)
+    return analogs
+
+
+def _safe_map(fn, items, deal_type):
+    for item in items:
+        try:
+            yield fn(item, deal_type)
+        except Exception:
+            logger.debug("Ошибка парсинга карточки", exc_info=True)
+
+
+def parse_cian_html(html, deal_type, url=None, params=None):
+    """
+    Извлекает аналоги из HTML страницы выдачи CIAN.
+    Сначала из встроенного JSON-состояния; если его нет или валидных аналогов
+    в нем не нашлось (сменилась схема) — из DOM.
+    """
+    try:
+        offers = _extract_embedded_offers(html)
+    except Exception:
+        logger.debug("Не удалось разобрать JSON-состояние url=%s", url, exc_info=True)
+        offers = None
+    if offers:
+        analogs = _collect_valid(_safe_map(_offer_to_analog, offers, deal_type))
+        if analogs:
+            return analogs
+        logger.info("В JSON-состоянии нет валидных аналогов, разбираем DOM url=%s", url)
+
+    try:
+        cards = _ENGINE.cards(html, deal_type)
 
         if not cards:
             logger.info("Не найдено карточек для deal_type=%s url=%s params=%s", deal_type, url, params)
             return []
 
-        analogs = []
-        for card in cards:
-            try:
-                # Извлекаем цену - разные селекторы для аренды и продажи
-                price_elem = None
-
-                if deal_type == 'sale':
-                    # Для продажи
-                    price_elem = (card.find('span', {'data-mark': 'MainPrice'}) or
-                                  card.find('span', class_=re.compile(r'price', re.I)))
-                else:
-                    # Для аренды
-                    price_elem = (card.find('span', {'data-mark': 'MainPrice'}) or
-                                  card.find('span', class_=re.compile(r'price|rent', re.I)) or
-                                  card.find('p', class_=re.compile(r'price', re.I)))
-
-                if not price_elem:
-                    continue
-
-                price_text = price_elem.get_text()
-                # Очищаем цену и учитываем, что аренда может быть в руб/мес
-                price_text_clean = re.sub(r'[^\d]', '', price_text.split('/')[0])  # Берем часть до "/"
-                price = float(price_text_clean) if price_text_clean else 0
-
-                if price == 0:
-                    continue
-
-                # Извлекаем площадь
-                area_elem = card.find('div', string=re.compile(r'м²'))
-                if not area_elem:
-                    # Альтернативные поиски площади
-                    area_elems = card.find_all('div', string=re.compile(r'(\d+[,.]?\d*)\s*м²'))
-                    if area_elems:
-                        area_elem = area_elems[0]
-
-                area_val = None
-                if area_elem:
-                    area_text = area_elem.get_text()
-                    area_match = re.search(r'(\d+[,.]?\d*)\s*м²', area_text)
-                    if area_match:
-                        area_val = float(area_match.group(1).replace(',', '.'))
-
-                # Извлекаем количество комнат
-                rooms_elem = card.find('div', string=re.compile(r'-комн|комнат|комн|Студия'))
-                rooms_val = None
-                if rooms_elem:
-                    rooms_text = rooms_elem.get_text()
-                    # Обработка студий
-                    if 'студия' in rooms_text.lower() or 'studio' in rooms_text.lower():
-                        rooms_val = 0
-                    else:
-                        rooms_match = re.search(r'(\d+)\s*[-]?комн', rooms_text)
-                        if rooms_match:
-                            rooms_val = int(rooms_match.group(1))
-
-                # Извлекаем адрес
-                address_elem = card.find('div', {'data-name': 'AddressContainer'})
-                if not address_elem:
-                    address_elem = card.find('a', {'data-name': 'Link'})  # Иногда адрес в ссылке
-
-                address = address_elem.get_text().strip() if address_elem else ''
-
-                # Извлекаем ссылку
-                link_elem = card.find('a', {'data-name': 'Link'})
-                if not link_elem:
-                    link_elem = card.find('a', href=re.compile(r'cian.ru/rent/flat|cian.ru/sale/flat'))
-
-                url = link_elem['href'] if link_elem and link_elem.has_attr('href') else ''
-                if url and not url.startswith('http'):
-                    url = 'https://www.cian.ru' + url
-
-                # Извлекаем этаж
-                floor_elem = card.find('div', string=re.compile(r'этаж'))
-                floor_info = ''
-                if floor_elem:
-                    floor_info = floor_elem.get_text().strip()
-
-                analog_data = {
-                    'price': price,
-                    'area_total': area_val,
-                    'rooms': rooms_val,
-                    'address': address,
-                    'url': url,
-                    'floor_info': floor_info,
-                    'deal_type': deal_type
-                }
-
-                # Валидация минимальных требований
-                if price > 0 and area_val and area_val > 10:  # Минимальная площадь 10 м²
-                    analogs.append(analog_data)
-
-            except Exception:
-                logger.debug("Ошибка парсинга карточки", exc_info=True)
-                continue
-
-        return analogs
+        return _collect_valid(_safe_map(_extract_card, cards, deal_type))
 
     except Exception:
         logger.warning("Ошибка парсинга страницы url=%s params=%s", url, params, exc_info=True)
         return []
 
-def get_cian_analogs(
+async def fetch_cian_listings(
         location: str,
         deal_type: str,
         rooms: int,
-        area: float,
+        min_area: Optional[float] = None,
+        max_area: Optional[float] = None,
         start_page: int = 1,
         end_page: int = 1
 ) -> List[Dict[str, Any]]:
     """
-    Парсит аналоги с CIAN для аренды или продажи
+    Загружает сырые объявления CIAN в заданном диапазоне площадей (без ранжирования).
+    Без границ площади загружается весь сегмент город/сделка/комнаты.
     """
 
-    # Получаем ID города через cianparser
-    valid_locations = cianparser.list_locations()
-    city_id = get_city_id(location, valid_locations)
+    # Получаем ID города через индекс локаций cianparser
+    city_id = get_city_id(location)
 
     if not city_id:
         logger.info("Не найден city_id для города '%s'", location)
         return []
 
-    logger.info("Парсинг Циан: city=%s city_id=%s deal_type=%s rooms=%s area=%s",
-                location, city_id, deal_type, rooms, area)
+    logger.info("Парсинг Циан: city=%s city_id=%s deal_type=%s rooms=%s area=[%s, %s]",
+                location, city_id, deal_type, rooms, min_area, max_area)
+
+    # Такой же поиск недавно ничего не нашел — не тратим запрос
+    empty_key = f"{city_id}:{deal_type}:{rooms}:{min_area}:{max_area}"
+    if await cian_guard.is_known_empty(empty_key):
+        logger.info("Поиск Циан недавно был пустым: %s", empty_key)
+        return []
 
     all_analogs = []
-    base_url = "https://www.cian.ru/cat.php"
+    base_url = f"{CIAN_BASE_URL}/cat.php"
 
     # Настройки парсинга в зависимости от типа сделки
     max_pages = 2 if deal_type == 'rent' else 3  # Меньше страниц для аренды
     end_page = min(end_page, max_pages)
 
-    for page in range(start_page, end_page + 1):
-        logger.debug("Парсим страницу=%s deal_type=%s", page, deal_type)
-
+    def build_params(page):
         # Базовые параметры
         params = {
             'deal_type': deal_type,
@@ -261,75 +466,116 @@ def get_cian_analogs(
             params['room4'] = 1
 
         # Дополнительные параметры для уточнения поиска
-        params['mintarea'] = max(area * 0.7, 20)  # Минимальная площадь -70%
-        params['maxtarea'] = area * 1.2  # Максимальная площадь +20%
-
-        try:
-            logger.debug("Парсинг страницы=%s deal_type=%s params=%s", page, deal_type, params)
-
-            analogs = parse_cian_page(base_url, params, DEFAULT_HEADERS, deal_type)
-
-            if not analogs:
-                logger.info("Нет аналогов на странице Циан=%s (stop)", page)
-                if page == start_page:
-                    return []
-                break
-
-            all_analogs.extend(analogs)
-            logger.debug("Найдено на странице=%s: %s", page, len(analogs))
+        if min_area is not None:
+            params['mintarea'] = min_area
+        if max_area is not None:
+            params['maxtarea'] = max_area
+        return params
+
+    # Все страницы запроса загружаем одновременно через общий пул соединений
+    pages = list(range(start_page, end_page + 1))
+    results = await asyncio.gather(
+        *(fetch_cian_page(base_url, build_params(page), DEFAULT_HEADERS, deal_type) for page in pages),
+        return_exceptions=True,
+    )
+
+    # Правила остановки применяем в порядке страниц, как при последовательном обходе
+    for page, result in zip(pages, results):
+        if isinstance(result, BaseException):
+            logger.warning("Ошибка парсинга страницы=%s", page, exc_info=result)
+            continue
 
-            time.sleep(0)
+        outcome, analogs = result
+        if not analogs:
+            logger.info("Нет аналогов на странице Циан=%s (stop)", page)
+            if page == start_page:
+                # Запоминаем только настоящую пустую выдачу, а не блокировку
+                if outcome == 'empty':
+                    await cian_guard.mark_empty(empty_key)
+                return []
+            break
 
-            if len(analogs) < 5 and page > start_page:
-                logger.info("Несколько предложений на странице=%s (found=%s), stop", page, len(analogs))
-                break
+        all_analogs.extend(analogs)
+        logger.debug("Найдено на странице=%s: %s", page, len(analogs))
 
-        except Exception:
-            logger.warning("Ошибка парсинга страницы=%s", page, exc_info=True)
-            continue
+        if len(analogs) < 5 and page > start_page:
+            logger.info("Несколько предложений на странице=%s (found=%s), stop", page, len(analogs))
+            break
 
     logger.info("Всего найдено объявлений для %s: %s", deal_type, len(all_analogs))
+    return all_analogs
 
-    # Фильтрация и сортировка результатов
-    if not all_analogs:
-        return []
 
-    # Фильтруем по площади (±20%)
-    area_tol = area * 0.2
-    filtered_analogs = [
-        flat for flat in all_analogs
-        if flat['area_total'] and abs(flat['area_total'] - area) <= area_tol
-    ]
+def similarity_weights(deal_type: str) -> Tuple[float, float]:
+    """
+    Веса похожести (площадь, комнаты): разница в комнату весит как 10 м² * rooms_weight.
+    Для аренды строже
+    """
+    if deal_type == 'rent':
+        return 2.0, 1.5  # Больший вес площади для аренды
+    return 1.0, 1.0
 
-    logger.info("После фильтрации по площади: %s объявлений", len(filtered_analogs))
 
-    # Сортировка по похожести (более строгая для аренды)
-    def similarity(flat):
-        flat_area = flat.get('area_total', 0)
-        flat_rooms = flat.get('rooms', -1)
+def analogs_limit(deal_type: str) -> int:
+    """Сколько самых похожих аналогов отдается (больше для аренды)"""
+    return 10 if deal_type == 'rent' else 7
 
-        # Весовые коэффициенты в зависимости от типа сделки
-        if deal_type == 'rent':
-            area_weight = 2.0  # Больший вес площади для аренды
-            rooms_weight = 1.5
-        else:
-            area_weight = 1.0
-            rooms_weight = 1.0
 
-        area_diff = abs(flat_area - area) * area_weight if flat_area else 1000
-        rooms_diff = abs(flat_rooms - rooms) * 10 * rooms_weight if flat_rooms != -1 else 500
+def select_cian_analogs(
+        listings: List[Dict[str, Any]],
+        location: str,
+        deal_type: str,
+        rooms: int,
+        area: float
+) -> List[Dict[str, Any]]:
+    """
+    Фильтрует и ранжирует объявления по похожести на искомую квартиру
+    """
 
-        return area_diff + rooms_diff
+    # Фильтрация и сортировка результатов
+    if not listings:
+        return []
 
-    filtered_analogs.sort(key=similarity)
+    # Фильтруем по площади (±20%) и ранжируем по похожести (более строгая для аренды)
+    # над столбцами numpy; словари копируются только для отобранных — исходные могут лежать в кэше
+    batch = AnalogBatch.from_listings(listings)
+    near = batch.near_area(area, 0.2)
+    logger.info("После фильтрации по площади: %s объявлений", len(near))
 
-    # Добавляем информацию о городе и регионе
-    for flat in filtered_analogs:
+    area_weight, rooms_weight = similarity_weights(deal_type)
+    scores = batch.similarity(rooms, area, area_weight, rooms_weight)[near]
+    region = get_region_from_city(location)
+
+    selected = []
+    for i in near[AnalogBatch.top_k(scores, analogs_limit(deal_type))]:
+        flat = dict(batch.records[i])
+        # Добавляем информацию о городе и регионе
         flat['city'] = location
-        flat['region'] = get_region_from_city(location)
+        flat['region'] = region
         # Добавляем форматированную цену для отображения
         flat['price_formatted'] = f"{flat['price']:,.0f}".replace(',', ' ')
+        selected.append(flat)
+    return selected
+
 
-    # Возвращаем наиболее похожие аналоги (больше для аренды)
-    max_results = 10 if deal_type == 'rent' else 7
-    return filtered_analogs[:max_results]
\ No newline at end of file
+async def get_cian_analogs(
+        location: str,
+        deal_type: str,
+        rooms: int,
+        area: float,
+        start_page: int = 1,
+        end_page: int = 1
+) -> List[Dict[str, Any]]:
+    """
+    Парсит аналоги с CIAN для аренды или продажи
+    """
+    listings = await fetch_cian_listings(
+        location=location,
+        deal_type=deal_type,
+        rooms=rooms,
+        min_area=max(area * 0.7, 20),  # Минимальная площадь -30%
+        max_area=area * 1.2,  # Максимальная площадь +20%
+        start_page=start_page,
+        end_page=end_page,
+    )
+    return select_cian_analogs(listings, location, deal_type, rooms, area)
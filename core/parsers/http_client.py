@@ -0,0 +1,34 @@
+import os
+from typing import Optional
+
+import httpx
+
+# Настройки пула соединений к внешним источникам
+HTTP_TIMEOUT = float(os.getenv("CIAN_HTTP_TIMEOUT", "15"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("CIAN_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("CIAN_HTTP_MAX_KEEPALIVE", "10"))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Возвращает общий асинхронный клиент с keep-alive пулом"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    """Закрывает пул соединений (при остановке приложения)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,75 @@
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+# Штрафы похожести за неизвестные площадь и комнаты (как в select_cian_analogs)
+_NO_AREA_PENALTY = 1000.0
+_NO_ROOMS_PENALTY = 500.0
+
+
+def trim_outliers_iqr(values: np.ndarray) -> np.ndarray:
+    """Отсекает значения за пределами 1.5 IQR от квартилей (от трех значений)"""
+    if len(values) < 3:
+        return values
+    q1, q3 = np.percentile(values, [25, 75])
+    iqr = q3 - q1
+    return values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+
+
+class AnalogBatch:
+    """
+    Объявления столбцами numpy (площадь, комнаты, цена) поверх исходных словарей.
+    Фильтры и ранжирование работают с массивами целиком; словари копируются
+    только для отобранных объявлений при выдаче
+    """
+
+    __slots__ = ('records', 'area', 'rooms', 'price')
+
+    def __init__(self, records: List[Dict[str, Any]], area: np.ndarray, rooms: np.ndarray, price: np.ndarray):
+        self.records = records
+        self.area = area  # 0 — площадь неизвестна
+        self.rooms = rooms  # -1 — комнаты неизвестны
+        self.price = price  # nan — цена неизвестна
+
+    @classmethod
+    def from_listings(cls, listings: Sequence[Dict[str, Any]]) -> "AnalogBatch":
+        n = len(listings)
+        area = np.fromiter((flat.get('area_total') or 0.0 for flat in listings), dtype=np.float64, count=n)
+        rooms = np.fromiter(
+            (-1 if flat.get('rooms') is None else flat['rooms'] for flat in listings), dtype=np.float64, count=n
+        )
+        price = np.fromiter(
+            (np.nan if flat.get('price') is None else flat['price'] for flat in listings), dtype=np.float64, count=n
+        )
+        return cls(list(listings), area, rooms, price)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def near_area(self, area: float, tolerance: float) -> np.ndarray:
+        """Индексы объявлений с известной площадью в пределах ±tolerance от искомой"""
+        return np.flatnonzero((self.area > 0) & (np.abs(self.area - area) <= area * tolerance))
+
+    def similarity(self, rooms: int, area: float, area_weight: float, rooms_weight: float) -> np.ndarray:
+        """Непохожесть каждого объявления на искомую квартиру (меньше — ближе)"""
+        area_diff = np.where(self.area > 0, np.abs(self.area - area) * area_weight, _NO_AREA_PENALTY)
+        rooms_diff = np.where(self.rooms != -1, np.abs(self.rooms - rooms) * 10 * rooms_weight, _NO_ROOMS_PENALTY)
+        return area_diff + rooms_diff
+
+    @staticmethod
+    def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        Позиции k наименьших оценок по возрастанию. argpartition вместо полной сортировки;
+        равные оценки — в исходном порядке, как при устойчивой сортировке
+        """
+        if len(scores) > k:
+            kth = scores[np.argpartition(scores, k - 1)[:k]].max()
+            candidates = np.flatnonzero(scores <= kth)
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.lexsort((candidates, scores[candidates]))][:k]
+
+    def prices_between(self, lo: float, hi: float) -> np.ndarray:
+        """Известные цены в допустимом диапазоне (в исходном порядке)"""
+        price = self.price
+        return price[(price >= lo) & (price <= hi)]
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from core.services.redis_client import REDIS_URL, get_redis
+
+logger = logging.getLogger(__name__)
+
+ANALOG_CACHE_TTL = int(os.getenv("ANALOG_CACHE_TTL", "900"))  # секунды
+ANALOG_CACHE_MAX_ENTRIES = int(os.getenv("ANALOG_CACHE_MAX_ENTRIES", "2048"))
+# Относительная ширина корзины площади: 0.1 -> соседние корзины отличаются на 10%
+ANALOG_CACHE_AREA_STEP = float(os.getenv("ANALOG_CACHE_AREA_STEP", "0.1"))
+# Сколько истекшие записи еще хранятся: их отдают, когда на живой поиск не осталось времени
+ANALOG_CACHE_STALE_TTL = int(os.getenv("ANALOG_CACHE_STALE_TTL", "21600"))  # секунды
+
+
+def area_bucket(area: float, step: float = ANALOG_CACHE_AREA_STEP) -> int:
+    """Номер корзины площади (логарифмическая шкала)"""
+    return int(math.floor(math.log(max(float(area), 1.0)) / math.log1p(step)))
+
+
+def bucket_bounds(bucket: int, step: float = ANALOG_CACHE_AREA_STEP) -> Tuple[float, float]:
+    """Границы площади [lo, hi) для корзины"""
+    base = 1.0 + step
+    return base ** bucket, base ** (bucket + 1)
+
+
+class TTLCache:
+    """
+    In-process LRU-кэш с ограничением времени жизни записей. При stale_ttl > 0
+    истекшая запись хранится еще stale_ttl секунд и доступна через get_stale
+    """
+
+    def __init__(self, max_entries: int, ttl: float, stale_ttl: float = 0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        now = time.monotonic()
+        if expires_at < now:
+            if expires_at + self.stale_ttl < now:
+                del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def get_stale(self, key: Hashable) -> Optional[Any]:
+        """Значение без учета ttl, пока не истек stale_ttl"""
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at + self.stale_ttl < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class AnalogCache:
+    """Двухуровневый кэш аналогов: LRU в процессе + опционально Redis"""
+
+    def __init__(self, ttl: int, max_entries: int, use_redis: bool = True, stale_ttl: int = 0):
+        self.ttl = ttl
+        self.memory = TTLCache(max_entries, ttl, stale_ttl)
+        self.use_redis = use_redis
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.counters = {
+            'memory_hits': 0, 'redis_hits': 0, 'misses': 0, 'coalesced': 0, 'stale_hits': 0, 'redis_errors': 0,
+        }
+
+    @staticmethod
+    def make_key(city: str, deal_type: str, rooms: int, area: float) -> str:
+        """Нормализованный ключ поиска: город, тип сделки, комнаты, корзина площади"""
+        return f"analogs:v1:{city.strip().casefold()}:{deal_type}:{int(rooms)}:{area_bucket(area)}"
+
+    def _get_redis(self):
+        return get_redis() if self.use_redis else None
+
+    async def _redis_get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        client = self._get_redis()
+        if client is None:
+            return None
+        try:
+            raw = await client.get(key)
+        except Exception:
+            self.counters['redis_errors'] += 1
+            logger.warning("Redis недоступен при чтении кэша аналогов", exc_info=True)
+            return None
+        return json.loads(raw) if raw else None
+
+    async def _redis_set(self, key: str, value: List[Dict[str, Any]]) -> None:
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            await client.set(key, json.dumps(value, ensure_ascii=False), ex=self.ttl)
+        except Exception:
+            self.counters['redis_errors'] += 1
+            logger.warning("Redis недоступен при записи кэша аналогов", exc_info=True)
+
+    async def get_or_load(
+            self,
+            key: str,
+            loader: Callable[[], Awaitable[List[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        """Возвращает значение из кэша или загружает его, объединяя одновременные промахи"""
+        value = self.memory.get(key)
+        if value is not None:
+            self.counters['memory_hits'] += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.counters['coalesced'] += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # Отменили первый запрос, а не этот: загружаем сами
+                return await self.get_or_load(key, loader)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._redis_get(key)
+            if value is not None:
+                self.counters['redis_hits'] += 1
+            else:
+                self.counters['misses'] += 1
+                value = await loader()
+                # Пустой результат не кэшируем: это может быть капча или временная блокировка
+                if value:
+                    await self._redis_set(key, value)
+            if value:
+                self.memory.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано текущему вызывающему; ожидающим — через future
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def get_stale(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Значение из памяти, в том числе истекшее, без похода в Redis и сеть"""
+        value = self.memory.get_stale(key)
+        if value is not None:
+            self.counters['stale_hits'] += 1
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий/промахов для мониторинга"""
+        lookups = self.counters['memory_hits'] + self.counters['redis_hits'] + self.counters['misses']
+        hits = self.counters['memory_hits'] + self.counters['redis_hits']
+        return {
+            **self.counters,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+            'entries': len(self.memory),
+            'evictions': self.memory.evictions,
+            'redis_enabled': self.use_redis and bool(REDIS_URL),
+        }
+
+
+analog_cache = AnalogCache(ANALOG_CACHE_TTL, ANALOG_CACHE_MAX_ENTRIES, stale_ttl=ANALOG_CACHE_STALE_TTL)
@@ -0,0 +1,296 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from core.services.analog_cache import TTLCache
+from core.services.metrics import CIAN_BREAKER_STATE, CIAN_RATE_LIMIT
+from core.services.redis_client import REDIS_URL, get_redis
+
+logger = logging.getLogger(__name__)
+
+# Общая для всех воркеров частота запросов к CIAN (страниц в секунду) и емкость ведра
+CIAN_RATE_START = float(os.getenv("CIAN_RATE_START", "2"))
+CIAN_RATE_MIN = float(os.getenv("CIAN_RATE_MIN", "0.2"))
+CIAN_RATE_MAX = float(os.getenv("CIAN_RATE_MAX", "5"))
+CIAN_RATE_BURST = float(os.getenv("CIAN_RATE_BURST", "5"))
+# AIMD: успешная страница прибавляет к частоте, 429/капча/403 умножают ее на коэффициент
+CIAN_RATE_INCREASE = float(os.getenv("CIAN_RATE_INCREASE", "0.05"))
+CIAN_RATE_DECREASE = float(os.getenv("CIAN_RATE_DECREASE", "0.5"))
+# Дольше ждать токен нет смысла: запрос уйдет без аналогов
+CIAN_RATE_MAX_WAIT = float(os.getenv("CIAN_RATE_MAX_WAIT", "1"))  # секунды
+
+# Столько сбоев подряд размыкают цепь; разомкнутая пропускает один пробный запрос
+# через cooldown, при неудаче пробы cooldown удваивается
+CIAN_BREAKER_THRESHOLD = int(os.getenv("CIAN_BREAKER_THRESHOLD", "3"))
+CIAN_BREAKER_COOLDOWN = float(os.getenv("CIAN_BREAKER_COOLDOWN", "60"))  # секунды
+CIAN_BREAKER_MAX_COOLDOWN = float(os.getenv("CIAN_BREAKER_MAX_COOLDOWN", "900"))  # секунды
+CIAN_BREAKER_PROBE_TIMEOUT = float(os.getenv("CIAN_BREAKER_PROBE_TIMEOUT", "30"))  # секунды
+
+# Сколько помнить, что поиск в городе ничего не нашел
+CIAN_NEGATIVE_TTL = int(os.getenv("CIAN_NEGATIVE_TTL", "600"))  # секунды
+
+GUARD_KEY = "cian:guard:v1"
+EMPTY_KEY_PREFIX = "cian:empty:v1:"
+STATE_TTL = 86400
+
+# Исходы страниц (см. count_cian_outcome): блокировки снижают частоту и размыкают цепь,
+# прочие сбои только размыкают, успех повышает частоту
+BLOCK_OUTCOMES = {'rate_limited', 'captcha', 'forbidden'}
+FAILURE_OUTCOMES = {'server_error', 'error'}
+BREAKER_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+# Время передается с клиента: расхождение часов воркеров мало по сравнению с секундами ведра.
+# ARGV: now, start_rate, burst, probe_timeout, ttl
+_ACQUIRE_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local s = redis.call('HMGET', key, 'tokens', 'ts', 'rate', 'state', 'open_until', 'probe_until')
+local state = s[4] or 'closed'
+if state == 'open' and now < tonumber(s[5]) then return {'breaker_open', '0'} end
+if state == 'half_open' and now < tonumber(s[6]) then return {'breaker_open', '0'} end
+local rate = tonumber(s[3]) or tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local tokens = tonumber(s[1]) or burst
+local ts = tonumber(s[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+if tokens < 1 then
+  redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+  return {'throttled', tostring((1 - tokens) / rate)}
+end
+redis.call('HSET', key, 'tokens', tokens - 1, 'ts', now)
+redis.call('EXPIRE', key, ARGV[5])
+if state ~= 'closed' then
+  redis.call('HSET', key, 'state', 'half_open', 'probe_until', now + tonumber(ARGV[4]))
+  return {'probe', '0'}
+end
+return {'ok', '0'}
+"""
+
+# ARGV: now, kind, probe, start_rate, min_rate, max_rate, increase, decrease,
+#       threshold, cooldown, max_cooldown, ttl
+_REPORT_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local s = redis.call('HMGET', key, 'rate', 'state', 'failures', 'cooldown')
+local rate = tonumber(s[1]) or tonumber(ARGV[4])
+local state = s[2] or 'closed'
+local failures = tonumber(s[3]) or 0
+local base = tonumber(ARGV[10])
+local cooldown = tonumber(s[4]) or base
+local probe = ARGV[3] == '1'
+if ARGV[2] == 'success' then
+  rate = math.min(tonumber(ARGV[6]), rate + tonumber(ARGV[7]))
+  failures = 0
+  if state == 'half_open' and probe then
+    state = 'closed'
+    cooldown = base
+  end
+else
+  if ARGV[2] == 'block' then rate = math.max(tonumber(ARGV[5]), rate * tonumber(ARGV[8])) end
+  failures = failures + 1
+  if state == 'half_open' and probe then
+    cooldown = math.min(tonumber(ARGV[11]), cooldown * 2)
+    state = 'open'
+    redis.call('HSET', key, 'open_until', now + cooldown)
+  elseif state == 'closed' and failures >= tonumber(ARGV[9]) then
+    state = 'open'
+    redis.call('HSET', key, 'open_until', now + cooldown)
+  end
+end
+redis.call('HSET', key, 'rate', rate, 'state', state, 'failures', failures, 'cooldown', cooldown)
+redis.call('EXPIRE', key, ARGV[12])
+return {state, tostring(rate)}
+"""
+
+
+def outcome_kind(outcome: str) -> Optional[str]:
+    if outcome in BLOCK_OUTCOMES:
+        return 'block'
+    if outcome in FAILURE_OUTCOMES:
+        return 'failure'
+    if outcome in ('ok', 'empty'):
+        return 'success'
+    return None
+
+
+class LocalGuardState:
+    """То же, что скрипты Lua, в памяти процесса: без Redis или при его недоступности"""
+
+    def __init__(self):
+        self.data: Dict[str, Any] = {}
+
+    def acquire(self, now: float) -> Tuple[str, float]:
+        d = self.data
+        state = d.get('state', 'closed')
+        if state == 'open' and now < d['open_until']:
+            return 'breaker_open', 0.0
+        if state == 'half_open' and now < d['probe_until']:
+            return 'breaker_open', 0.0
+        rate = d.get('rate', CIAN_RATE_START)
+        tokens = min(CIAN_RATE_BURST, d.get('tokens', CIAN_RATE_BURST) + max(0.0, now - d.get('ts', now)) * rate)
+        d['ts'] = now
+        if tokens < 1:
+            d['tokens'] = tokens
+            return 'throttled', (1 - tokens) / rate
+        d['tokens'] = tokens - 1
+        if state != 'closed':
+            d['state'], d['probe_until'] = 'half_open', now + CIAN_BREAKER_PROBE_TIMEOUT
+            return 'probe', 0.0
+        return 'ok', 0.0
+
+    def report(self, now: float, kind: str, probe: bool) -> Tuple[str, float]:
+        d = self.data
+        rate = d.get('rate', CIAN_RATE_START)
+        state = d.get('state', 'closed')
+        cooldown = d.get('cooldown', CIAN_BREAKER_COOLDOWN)
+        if kind == 'success':
+            rate = min(CIAN_RATE_MAX, rate + CIAN_RATE_INCREASE)
+            d['failures'] = 0
+            if state == 'half_open' and probe:
+                state, cooldown = 'closed', CIAN_BREAKER_COOLDOWN
+        else:
+            if kind == 'block':
+                rate = max(CIAN_RATE_MIN, rate * CIAN_RATE_DECREASE)
+            d['failures'] = d.get('failures', 0) + 1
+            if state == 'half_open' and probe:
+                cooldown = min(CIAN_BREAKER_MAX_COOLDOWN, cooldown * 2)
+                state, d['open_until'] = 'open', now + cooldown
+            elif state == 'closed' and d['failures'] >= CIAN_BREAKER_THRESHOLD:
+                state, d['open_until'] = 'open', now + cooldown
+        d['rate'], d['state'], d['cooldown'] = rate, state, cooldown
+        return state, rate
+
+
+class SourceGuard:
+    """
+    Защита источника объявлений: общее для кластера ведро токенов с AIMD-подстройкой
+    частоты, размыкатель цепи с пробным запросом и отрицательный кэш пустых поисков.
+    Состояние в Redis; без него — в памяти процесса
+    """
+
+    def __init__(self, key: str = GUARD_KEY, use_redis: bool = True):
+        self.key = key
+        self.use_redis = use_redis
+        self.local = LocalGuardState()
+        self.empty = TTLCache(4096, CIAN_NEGATIVE_TTL)
+        self._scripts: Optional[Tuple[Any, Any, Any]] = None
+        self.state = 'closed'
+        self.rate = CIAN_RATE_START
+        self.counters = {'allowed': 0, 'probes': 0, 'throttled': 0, 'breaker_open': 0,
+                         'negative_hits': 0, 'redis_errors': 0}
+        self._publish()
+
+    def _get_redis(self):
+        return get_redis() if self.use_redis else None
+
+    def _script(self, client, index: int):
+        # Клиент пересоздается в каждом asyncio.run воркера — скрипты привязываем к текущему
+        if self._scripts is None or self._scripts[0] is not client:
+            self._scripts = (client, client.register_script(_ACQUIRE_LUA), client.register_script(_REPORT_LUA))
+        return self._scripts[index]
+
+    def _redis_failed(self, action: str) -> None:
+        self.counters['redis_errors'] += 1
+        logger.warning("Redis недоступен (%s), ограничитель CIAN работает локально", action, exc_info=True)
+
+    def _publish(self) -> None:
+        CIAN_RATE_LIMIT.set(self.rate)
+        CIAN_BREAKER_STATE.set(BREAKER_STATES[self.state])
+
+    async def _try_acquire(self) -> Tuple[str, float]:
+        now = time.time()
+        client = self._get_redis()
+        if client is not None:
+            try:
+                decision, wait = await self._script(client, 1)(
+                    keys=[self.key],
+                    args=[now, CIAN_RATE_START, CIAN_RATE_BURST, CIAN_BREAKER_PROBE_TIMEOUT, STATE_TTL],
+                )
+                return decision.decode(), float(wait)
+            except Exception:
+                self._redis_failed("acquire")
+        return self.local.acquire(now)
+
+    async def acquire(self) -> str:
+        """
+        Разрешение на запрос страницы: 'ok', 'probe' (пробный запрос разомкнутой цепи),
+        'breaker_open' или 'throttled' — в последних двух случаях в сеть не идем
+        """
+        deadline = time.monotonic() + CIAN_RATE_MAX_WAIT
+        while True:
+            decision, wait = await self._try_acquire()
+            if decision != 'throttled' or time.monotonic() + wait > deadline:
+                break
+            await asyncio.sleep(wait)
+        if decision == 'ok':
+            self.counters['allowed'] += 1
+        elif decision == 'probe':
+            self.counters['probes'] += 1
+            logger.info("CIAN: пробный запрос после размыкания цепи")
+        else:
+            self.counters[decision] += 1
+        return decision
+
+    async def report(self, outcome: str, probe: bool = False) -> None:
+        """Исход страницы: подстройка частоты и состояния цепи"""
+        kind = outcome_kind(outcome)
+        if kind is None:
+            return
+        now = time.time()
+        client = self._get_redis()
+        state = None
+        if client is not None:
+            try:
+                state, rate = await self._script(client, 2)(
+                    keys=[self.key],
+                    args=[now, kind, int(probe), CIAN_RATE_START, CIAN_RATE_MIN, CIAN_RATE_MAX,
+                          CIAN_RATE_INCREASE, CIAN_RATE_DECREASE, CIAN_BREAKER_THRESHOLD,
+                          CIAN_BREAKER_COOLDOWN, CIAN_BREAKER_MAX_COOLDOWN, STATE_TTL],
+                )
+                state, rate = state.decode(), float(rate)
+            except Exception:
+                self._redis_failed("report")
+                state = None
+        if state is None:
+            state, rate = self.local.report(now, kind, probe)
+
+        if state != self.state:
+            logger.warning("CIAN: цепь %s -> %s (исход %s, частота %.2f/с)", self.state, state, outcome, rate)
+        self.state, self.rate = state, rate
+        self._publish()
+
+    async def is_known_empty(self, search: str) -> bool:
+        """Недавний такой же поиск ничего не нашел — в сеть не идем"""
+        found = self.empty.get(search) is not None
+        client = self._get_redis()
+        if not found and client is not None:
+            try:
+                found = bool(await client.exists(EMPTY_KEY_PREFIX + search))
+            except Exception:
+                self._redis_failed("negative cache read")
+        if found:
+            self.counters['negative_hits'] += 1
+        return found
+
+    async def mark_empty(self, search: str) -> None:
+        self.empty.set(search, True)
+        client = self._get_redis()
+        if client is not None:
+            try:
+                await client.set(EMPTY_KEY_PREFIX + search, 1, ex=CIAN_NEGATIVE_TTL)
+            except Exception:
+                self._redis_failed("negative cache write")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            'state': self.state,
+            'rate': round(self.rate, 3),
+            'negative_entries': len(self.empty),
+            'redis_enabled': self.use_redis and bool(REDIS_URL),
+        }
+
+
+cian_guard = SourceGuard()
@@ -1,5 +1,197 @@
+import asyncio
+import gzip
+import hashlib
+import heapq
 import json
-from typing import Dict, List
+import logging
+import os
+import threading
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli — необязательная зависимость
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+REGIONS_PATH = os.getenv("REGIONS_PATH", str(BASE_DIR / "config" / "regions.json"))
+# Период проверки файла справочника на изменения; 0 — не следить
+REGIONS_WATCH_INTERVAL = float(os.getenv("REGIONS_WATCH_INTERVAL", "5"))  # секунды
+
+# Минимальная доля общих триграмм для нечеткого совпадения (опечатки)
+FUZZY_MIN_SCORE = 0.5
+
+
+def normalize_name(name: str) -> str:
+    """Ключ для сравнения названий: регистр и ё/е не важны"""
+    return name.strip().casefold().replace('ё', 'е')
+
+
+def _grams(key: str, n: int) -> Set[str]:
+    return {key[i:i + n] for i in range(len(key) - n + 1)}
+
+
+def location_entries(region_to_cities: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+    """Плоский список локаций: регион, затем его города"""
+    entries = []
+    for region, cities in region_to_cities.items():
+        entries.append({
+            'type': 'region',
+            'name': region,
+            'value': region
+        })
+        for city in cities:
+            entries.append({
+                'type': 'city',
+                'name': city,
+                'value': city,
+                'region': region,
+                'parent': region
+            })
+    return entries
+
+
+class LocationsPayload:
+    """Готовое тело ответа /api/locations: JSON, ETag и сжатые варианты"""
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        # Тот же формат, что у JSONResponse FastAPI
+        self.body: bytes = json.dumps(
+            entries, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+        ).encode("utf-8")
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        # mtime=0 — одинаковые байты при одинаковых данных
+        self.encoded: Dict[str, bytes] = {'gzip': gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encoded['br'] = brotli.compress(self.body)
+        # Сильный ETag обещает побайтовое совпадение, поэтому у каждого сжатого варианта свой
+        self.etags: Dict[str, str] = {coding: f'"{digest}-{coding}"' for coding in self.encoded}
+        self._known_tags = {self.etag, *self.etags.values()}
+
+    def etag_for(self, coding: Optional[str]) -> str:
+        """ETag отдаваемого варианта: без сжатия или в заданной кодировке"""
+        return self.etags[coding] if coding else self.etag
+
+    def get_encoded(self, accept_encoding: str) -> Optional[Tuple[str, bytes]]:
+        """Лучший поддерживаемый клиентом сжатый вариант или None"""
+        accepted = set()
+        for part in accept_encoding.split(','):
+            coding, _, params = part.partition(';')
+            coding = coding.strip().lower()
+            quality = params.replace(' ', '').lower()
+            try:
+                if quality.startswith('q=') and float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+            if coding:
+                accepted.add(coding)
+        for coding in ('br', 'gzip'):
+            if coding in self.encoded and (coding in accepted or '*' in accepted):
+                return coding, self.encoded[coding]
+        return None
+
+    def matches(self, if_none_match: str) -> bool:
+        """
+        Проверка If-None-Match (слабое сравнение, как требует RFC 9110) по ETag
+        всех вариантов: закэшированное в любой кодировке тело актуально
+        """
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag == '*' or tag.removeprefix('W/') in self._known_tags:
+                return True
+        return False
+
+
+class LocationSearchIndex:
+    """
+    Индекс автодополнения по регионам и городам.
+    Записи отсортированы по нормализованному имени, поэтому префиксный поиск —
+    это bisect по массиву ключей, а списки n-грамм уже упорядочены по имени
+    """
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        keys = [normalize_name(e['name']) for e in entries]
+        # При равных именах сохраняется исходный порядок (регион раньше своих городов)
+        order = sorted(range(len(entries)), key=lambda i: (keys[i], i))
+        self.entries: List[Dict[str, Any]] = [entries[i] for i in order]
+        self.keys: List[str] = [keys[i] for i in order]
+
+        # n-граммы длиной 1..3 -> id записей по возрастанию (= по имени)
+        self.grams: Dict[str, List[int]] = {}
+        for entry_id, key in enumerate(self.keys):
+            for n in (1, 2, 3):
+                for gram in _grams(key, n):
+                    self.grams.setdefault(gram, []).append(entry_id)
+
+    def _prefix_ids(self, query: str, limit: int) -> List[int]:
+        ids = []
+        i = bisect_left(self.keys, query)
+        while i < len(self.keys) and len(ids) < limit and self.keys[i].startswith(query):
+            ids.append(i)
+            i += 1
+        return ids
+
+    def _substring_ids(self, query: str, limit: int) -> List[int]:
+        """Совпадения не с начала имени, в порядке имени"""
+        if len(query) <= 3:
+            candidates = self.grams.get(query, [])
+            check = False
+        else:
+            postings = [self.grams.get(g) for g in _grams(query, 3)]
+            if any(p is None for p in postings):
+                return []
+            candidates = min(postings, key=len)
+            check = True
+
+        ids = []
+        for entry_id in candidates:
+            key = self.keys[entry_id]
+            if key.startswith(query) or (check and query not in key):
+                continue
+            ids.append(entry_id)
+            if len(ids) >= limit:
+                break
+        return ids
+
+    def _fuzzy_ids(self, query: str, limit: int, exclude: Set[int]) -> List[int]:
+        """Похожие по триграммам имена — на случай опечаток"""
+        trigrams = _grams(query, 3)
+        if not trigrams:
+            return []
+        shared = Counter()
+        for gram in trigrams:
+            shared.update(self.grams.get(gram, ()))
+        scored = (
+            (count / max(len(trigrams), len(self.keys[entry_id]) - 2), entry_id)
+            for entry_id, count in shared.items()
+            if entry_id not in exclude
+        )
+        best = heapq.nsmallest(limit, ((-score, entry_id) for score, entry_id in scored if score >= FUZZY_MIN_SCORE))
+        return [entry_id for _, entry_id in best]
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Сначала совпадения с начала имени, затем по подстроке (каждая группа по алфавиту),
+        затем нечеткие совпадения, если точных не хватило до limit
+        """
+        query = normalize_name(query)
+        if not query:
+            return []
+
+        ids = self._prefix_ids(query, limit)
+        if len(ids) < limit:
+            ids += self._substring_ids(query, limit - len(ids))
+        if len(ids) < limit:
+            ids += self._fuzzy_ids(query, limit - len(ids), set(ids))
+        return [self.entries[i] for i in ids]
 
 
 class CityRegionMapper:
@@ -11,12 +203,106 @@ class CityRegionMapper:
         self.city_to_region = {}
         for region, cities in self.region_to_cities.items():
             for city in cities:
-                self.city_to_region[city.lower()] = region
+                self.city_to_region[normalize_name(city)] = region
+
+        entries = location_entries(self.region_to_cities)
+        self.search_index = LocationSearchIndex(entries)
+        self.locations_payload = LocationsPayload(entries)
 
     def get_region_from_city(self, city: str) -> str:
         """Возвращает регион по названию города"""
-        return self.city_to_region.get(city.lower(), "Неизвестный регион")
+        return self.city_to_region.get(normalize_name(city), "Неизвестный регион")
 
     def get_cities_by_region(self, region: str) -> List[str]:
         """Возвращает список городов в регионе"""
-        return self.region_to_cities.get(region, [])
\ No newline at end of file
+        return self.region_to_cities.get(region, [])
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Поиск регионов и городов для автодополнения"""
+        return self.search_index.search(query, limit)
+
+
+class CityRegionService:
+    """
+    Общий справочник регионов с горячей перезагрузкой.
+    Новая версия CityRegionMapper строится целиком в стороне и подменяется одной
+    операцией присваивания, поэтому запрос видит либо старую, либо новую версию
+    """
+
+    def __init__(self, json_path: str, watch_interval: float):
+        self.json_path = Path(json_path)
+        self.watch_interval = watch_interval
+        self.version = 0
+        self._current: Optional[CityRegionMapper] = None
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._failed_stamp: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+
+    @property
+    def current(self) -> CityRegionMapper:
+        """Текущая версия справочника (в запросе берется один раз)"""
+        mapper = self._current
+        if mapper is None:
+            self.reload()
+            mapper = self._current
+        return mapper
+
+    def _file_stamp(self) -> Tuple[int, int]:
+        stat = os.stat(self.json_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Перечитывает файл, если он изменился. Возвращает True, если версия сменилась.
+        При ошибке чтения исключение пробрасывается, а текущая версия остается в работе
+        """
+        with self._lock:
+            stamp = self._file_stamp()
+            if not force and self._current is not None and stamp in (self._stamp, self._failed_stamp):
+                return False
+            try:
+                mapper = CityRegionMapper(str(self.json_path))
+            except Exception:
+                # Битый файл не перечитываем, пока он снова не изменится
+                self._failed_stamp = stamp
+                raise
+            self._current = mapper
+            self._stamp = stamp
+            self.version += 1
+        logger.info("Справочник регионов загружен: версия %s, регионов %s",
+                    self.version, len(mapper.region_to_cities))
+        return True
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            try:
+                await asyncio.to_thread(self.reload)
+            except Exception:
+                logger.warning("Не удалось перезагрузить %s, работает версия %s",
+                               self.json_path, self.version, exc_info=True)
+
+    def start_watching(self) -> None:
+        if self.watch_interval > 0 and self._watch_task is None:
+            self._watch_task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop_watching(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        mapper = self._current
+        return {
+            'version': self.version,
+            'regions_count': len(mapper.region_to_cities) if mapper is not None else 0,
+            'watching': self._watch_task is not None,
+        }
+
+
+city_regions = CityRegionService(REGIONS_PATH, REGIONS_WATCH_INTERVAL)
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from core.services.metrics import collect_stages, observe_stages, stage_timer
+
+logger = logging.getLogger(__name__)
+
+# thread — работа в пуле потоков текущего процесса (по умолчанию),
+# process — пул процессов, в каждом модели загружаются один раз при старте
+EXECUTOR_MODE = os.getenv("AXIOMLY_EXECUTOR", "thread")
+EXECUTOR_WORKERS = int(os.getenv("AXIOMLY_EXECUTOR_WORKERS", str(os.cpu_count() or 2)))
+
+# Модели процесса-воркера (заполняется инициализатором пула)
+_worker_models = None
+
+
+def _init_worker(models_dir: str) -> None:
+    global _worker_models
+    from core.services.model_registry import ModelRegistry
+    _worker_models = ModelRegistry.load_from_disk(models_dir)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _worker_model(deal_type: str, version: str):
+    if _worker_models is None:
+        raise RuntimeError(f"Модель {deal_type} не загружена в процессе-воркере")
+    # Воркер следует за версией родителя: если ее переключили, подгружаем ту же.
+    # Битая у воркера версия запоминается, прогноз считает предыдущая
+    model = _worker_models.follow(deal_type, version)
+    if model is None:
+        raise RuntimeError(f"Модель {deal_type} версии {version} не загружена в процессе-воркере")
+    return model
+
+
+def _activate_in_worker(deal_type: str, version: str) -> int:
+    _worker_model(deal_type, version)
+    return os.getpid()
+
+
+def _predict_in_worker(inputs: List[Dict[str, Any]], deal_type: str, version: str) -> List[float]:
+    from predict_price import predict_ml_price, predict_ml_prices
+
+    model = _worker_model(deal_type, version)
+    if len(inputs) == 1:
+        return [predict_ml_price(inputs[0], deal_type, model)]
+    return predict_ml_prices(inputs, deal_type, model)
+
+
+def _predict_local(inputs: List[Dict[str, Any]], deal_type: str, model) -> List[float]:
+    from predict_price import predict_ml_price, predict_ml_prices
+
+    if len(inputs) == 1:
+        return [predict_ml_price(inputs[0], deal_type, model)]
+    return predict_ml_prices(inputs, deal_type, model)
+
+
+def _parse_html(html: str, deal_type: str, url=None, params=None):
+    from core.parsers.cian_parser import parse_cian_html
+    with stage_timer('cian_parse'):
+        return parse_cian_html(html, deal_type, url, params)
+
+
+class ComputeExecutor:
+    """Выполняет CPU-задачи (разбор HTML, инференс) вне event loop"""
+
+    def __init__(self, mode: str, workers: int):
+        self.mode = mode
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self, models_dir: str) -> None:
+        if self.mode != "process" or self._pool is not None:
+            return
+        # spawn, а не fork: в родителе уже работают потоки event loop и CatBoost
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(models_dir,),
+        )
+        # Поднимаем все процессы сразу, чтобы загрузка моделей не пришлась на первые запросы
+        pids = {f.result() for f in [self._pool.submit(_ping) for _ in range(self.workers)]}
+        logger.info("Пул процессов запущен: %s воркеров", len(pids))
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def predict(self, inputs: List[Dict[str, Any]], deal_type: str, model) -> List[float]:
+        """Прогноз модели для одного или нескольких объектов"""
+        if self._pool is None:
+            return await asyncio.to_thread(_predict_local, inputs, deal_type, model)
+        loop = asyncio.get_running_loop()
+        # Замеры этапов из процесса-воркера возвращаются вместе с результатом
+        prices, timings = await loop.run_in_executor(
+            self._pool, collect_stages, _predict_in_worker, inputs, deal_type, model.version
+        )
+        observe_stages(timings)
+        return prices
+
+    def activate(self, swapped: Dict[str, str]) -> None:
+        """Заранее переключает процессы-воркеры на новые версии моделей"""
+        if self._pool is None:
+            return
+        # Как и при старте, по задаче на воркер; пропустивший догонит при первом прогнозе
+        futures = [
+            self._pool.submit(_activate_in_worker, deal_type, version)
+            for deal_type, version in swapped.items()
+            for _ in range(self.workers)
+        ]
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                logger.warning("Воркер не смог переключить версию модели", exc_info=True)
+
+    async def parse_html(self, html: str, deal_type: str, url=None, params=None):
+        """Разбор страницы выдачи CIAN"""
+        if self._pool is None:
+            return await asyncio.to_thread(_parse_html, html, deal_type, url, params)
+        loop = asyncio.get_running_loop()
+        analogs, timings = await loop.run_in_executor(
+            self._pool, collect_stages, _parse_html, html, deal_type, url, params
+        )
+        observe_stages(timings)
+        return analogs
+
+    def stats(self) -> Dict[str, Any]:
+        return {'mode': self.mode if self._pool is not None else 'thread', 'workers': self.workers}
+
+
+compute_executor = ComputeExecutor(EXECUTOR_MODE, EXECUTOR_WORKERS)
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sklearn.neighbors import KDTree
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from core.db.models import Listing
+from core.db.session import AsyncSessionLocal, engine, get_sync_sessionmaker
+from core.parsers.cian_parser import similarity_weights
+from core.services.analog_batch import AnalogBatch
+
+logger = logging.getLogger(__name__)
+
+# Включать после миграции listings и при доступном Postgres: иначе каждый новый город — ошибка БД
+LISTING_STORE_ENABLED = os.getenv("LISTING_STORE_ENABLED", "0") == "1"
+# Объявления, не встречавшиеся дольше, в поиск аналогов не попадают
+LISTING_MAX_AGE_DAYS = float(os.getenv("LISTING_MAX_AGE_DAYS", "14"))
+# Как часто индекс города перестраивается из БД (старый отдается, пока строится новый)
+LISTING_INDEX_TTL = int(os.getenv("LISTING_INDEX_TTL", "300"))  # секунды
+# Сколько ближайших объявлений отдается на общее ранжирование
+LISTING_INDEX_CANDIDATES = int(os.getenv("LISTING_INDEX_CANDIDATES", "50"))
+
+_UPDATE_COLUMNS = ('source', 'city', 'deal_type', 'rooms', 'area_total', 'price', 'address', 'floor_info')
+
+
+def listing_rows(city: str, deal_type: str, listings: List[Dict[str, Any]], source: str = 'cian') -> List[Dict[str, Any]]:
+    """Строки для upsert; без ссылки, площади, цены или комнат объявление не сохраняется"""
+    rows: Dict[str, Dict[str, Any]] = {}
+    for flat in listings:
+        url = flat.get('url')
+        if not url or flat.get('rooms') is None or not flat.get('area_total') or not flat.get('price'):
+            continue
+        # В одном INSERT ... ON CONFLICT строка не может обновляться дважды
+        rows[url] = {
+            'id': str(uuid.uuid4()),
+            'url': url[:1024],
+            'source': source,
+            'city': city.strip().casefold(),
+            'deal_type': flat.get('deal_type') or deal_type,
+            'rooms': int(flat['rooms']),
+            'area_total': float(flat['area_total']),
+            'price': float(flat['price']),
+            'address': (flat.get('address') or '')[:1024],
+            'floor_info': (flat.get('floor_info') or '')[:100],
+        }
+    return list(rows.values())
+
+
+def upsert_statement():
+    stmt = pg_insert(Listing.__table__)
+    return stmt.on_conflict_do_update(
+        index_elements=['url'],
+        set_={**{column: stmt.excluded[column] for column in _UPDATE_COLUMNS}, 'last_seen_at': func.now()},
+    )
+
+
+def upsert_listings(city: str, deal_type: str, listings: List[Dict[str, Any]], source: str = 'cian') -> int:
+    """Сохраняет объявления сегмента (из воркера). Возвращает число строк"""
+    rows = listing_rows(city, deal_type, listings, source)
+    if not rows:
+        return 0
+    with get_sync_sessionmaker()() as session:
+        session.execute(upsert_statement(), rows)
+        session.commit()
+    return len(rows)
+
+
+class CityListingIndex:
+    """
+    Объявления города и типа сделки: массивы numpy и KD-дерево в координатах
+    (площадь * area_weight, комнаты * 10 * rooms_weight). Расстояние L1 в них
+    совпадает с похожестью select_cian_analogs
+    """
+
+    def __init__(self, deal_type: str, listings: List[Dict[str, Any]]):
+        self.batch = AnalogBatch.from_listings(listings)
+        self.area_weight, self.rooms_weight = similarity_weights(deal_type)
+        self.built_at = time.monotonic()
+        self.tree = None
+        if listings:
+            self.tree = KDTree(self._scale(np.column_stack((self.batch.area, self.batch.rooms))), metric='manhattan')
+
+    def _scale(self, points: np.ndarray) -> np.ndarray:
+        return points * np.array([self.area_weight, 10 * self.rooms_weight])
+
+    def nearest(self, rooms: int, area: float, k: int) -> List[Dict[str, Any]]:
+        if self.tree is None:
+            return []
+        query = self._scale(np.array([[float(area), float(rooms)]]))
+        _, idx = self.tree.query(query, k=min(k, len(self.batch)))
+        records = self.batch.records
+        return [records[i] for i in idx[0]]
+
+    def __len__(self) -> int:
+        return len(self.batch)
+
+
+class ListingStore:
+    """Хранилище объявлений в Postgres с индексом ближайших соседей по городам в памяти"""
+
+    def __init__(self, max_age_days: float, index_ttl: int, candidates: int, enabled: bool = True):
+        self.max_age_days = max_age_days
+        self.index_ttl = index_ttl
+        self.candidates = candidates
+        self.enabled = enabled
+        self._indexes: Dict[Tuple[str, str], CityListingIndex] = {}
+        self._building: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.counters = {'saved': 0, 'save_failed': 0, 'builds': 0, 'build_failed': 0, 'queries': 0}
+
+    async def save(self, city: str, deal_type: str, listings: List[Dict[str, Any]], source: str = 'cian') -> None:
+        """Сохраняет свежескрейпленные объявления (после живого скрейпа в API)"""
+        if not self.enabled:
+            return
+        rows = listing_rows(city, deal_type, listings, source)
+        if not rows:
+            return
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(upsert_statement(), rows)
+        except Exception:
+            self.counters['save_failed'] += len(rows)
+            logger.warning("Не удалось сохранить %s объявлений в БД", len(rows), exc_info=True)
+            return
+        self.counters['saved'] += len(rows)
+
+    async def _load(self, city_key: str, deal_type: str) -> List[Dict[str, Any]]:
+        seen_after = datetime.now(timezone.utc) - timedelta(days=self.max_age_days)
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(
+                    Listing.url, Listing.rooms, Listing.area_total, Listing.price,
+                    Listing.address, Listing.floor_info, Listing.deal_type,
+                ).where(
+                    Listing.city == city_key,
+                    Listing.deal_type == deal_type,
+                    Listing.last_seen_at >= seen_after,
+                )
+            )
+            return [dict(row._mapping) for row in result]
+
+    async def _build(self, key: Tuple[str, str]) -> CityListingIndex:
+        try:
+            listings = await self._load(*key)
+            index = await asyncio.to_thread(CityListingIndex, key[1], listings)
+            self.counters['builds'] += 1
+        except Exception:
+            self.counters['build_failed'] += 1
+            logger.warning("Не удалось построить индекс объявлений %s", key, exc_info=True)
+            # Пустой индекс до следующей попытки: недоступную БД не опрашиваем на каждом запросе
+            index = self._indexes.get(key) or CityListingIndex(key[1], [])
+            index.built_at = time.monotonic()
+        self._indexes[key] = index
+        return index
+
+    def _start_build(self, key: Tuple[str, str]) -> asyncio.Task:
+        task = self._building.get(key)
+        if task is None:
+            task = self._building[key] = asyncio.ensure_future(self._build(key))
+            task.add_done_callback(lambda _: self._building.pop(key, None))
+        return task
+
+    async def get_index(self, city: str, deal_type: str) -> CityListingIndex:
+        key = (city.strip().casefold(), deal_type)
+        index = self._indexes.get(key)
+        if index is None:
+            # Первый запрос по городу ждет построения; одновременные ждут одно построение
+            return await asyncio.shield(self._start_build(key))
+        if time.monotonic() - index.built_at > self.index_ttl:
+            self._start_build(key)
+        return index
+
+    async def nearest(self, city: str, deal_type: str, rooms: int, area: float, k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Ближайшие по похожести объявления города, увиденные за последние max_age_days"""
+        if not self.enabled:
+            return []
+        index = await self.get_index(city, deal_type)
+        self.counters['queries'] += 1
+        return index.nearest(rooms, area, k or self.candidates)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            'enabled': self.enabled,
+            'indexes': len(self._indexes),
+            'listings': sum(len(index) for index in self._indexes.values()),
+        }
+
+
+listing_store = ListingStore(LISTING_MAX_AGE_DAYS, LISTING_INDEX_TTL, LISTING_INDEX_CANDIDATES, LISTING_STORE_ENABLED)
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.services.analog_cache import TTLCache
+from core.services.redis_client import get_redis, get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+# Максимальный возраст снапшота, который еще можно отдавать в /api/predict
+ANALOG_SNAPSHOT_MAX_AGE = int(os.getenv("ANALOG_SNAPSHOT_MAX_AGE", "21600"))  # секунды
+# Как долго процесс не повторяет регистрацию уже зарегистрированного сегмента
+SEGMENT_REGISTER_TTL = int(os.getenv("SEGMENT_REGISTER_TTL", "3600"))  # секунды
+
+SEGMENTS_KEY = "analogs:segments"
+
+# Сегменты, которые этот процесс уже добавил в SEGMENTS_KEY
+_registered = TTLCache(max_entries=4096, ttl=SEGMENT_REGISTER_TTL)
+
+
+def segment_rooms(rooms: int) -> int:
+    """4 и более комнат CIAN ищет одним фильтром"""
+    return min(max(int(rooms), 0), 4)
+
+
+def segment_key(city: str, deal_type: str, rooms: int) -> str:
+    return f"analogs:snapshot:v1:{city.strip().casefold()}:{deal_type}:{segment_rooms(rooms)}"
+
+
+def encode_segment(city: str, deal_type: str, rooms: int) -> str:
+    return json.dumps([city.strip(), deal_type, segment_rooms(rooms)], ensure_ascii=False)
+
+
+def decode_segment(raw) -> Tuple[str, str, int]:
+    city, deal_type, rooms = json.loads(raw)
+    return city, deal_type, int(rooms)
+
+
+async def read_snapshot(city: str, deal_type: str, rooms: int) -> Optional[List[Dict[str, Any]]]:
+    """Свежий снапшот объявлений сегмента или None"""
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        raw = await client.get(segment_key(city, deal_type, rooms))
+    except Exception:
+        logger.warning("Redis недоступен при чтении снапшота", exc_info=True)
+        return None
+    if not raw:
+        return None
+    data = json.loads(raw)
+    if time.time() - data['scraped_at'] > ANALOG_SNAPSHOT_MAX_AGE:
+        return None
+    return data['listings']
+
+
+async def register_segment(city: str, deal_type: str, rooms: int) -> None:
+    """Запоминает востребованный сегмент, чтобы фоновая задача начала его обновлять"""
+    client = get_redis()
+    if client is None:
+        return
+    segment = encode_segment(city, deal_type, rooms)
+    # Множество меняется редко: повторный SADD — лишний поход в Redis на каждом запросе
+    if _registered.get(segment) is not None:
+        return
+    try:
+        await client.sadd(SEGMENTS_KEY, segment)
+    except Exception:
+        logger.warning("Redis недоступен при регистрации сегмента", exc_info=True)
+        return
+    _registered.set(segment, True)
+
+
+def list_registered_segments() -> List[Tuple[str, str, int]]:
+    """Сегменты, запрошенные через /api/predict (для фоновой задачи)"""
+    return [decode_segment(raw) for raw in get_sync_redis().smembers(SEGMENTS_KEY)]
+
+
+def store_snapshot(city: str, deal_type: str, rooms: int, listings: List[Dict[str, Any]]) -> None:
+    """Сохраняет снапшот сегмента в Redis и в таблицу market_snapshots (из воркера)"""
+    from core.db.models import MarketSnapshot
+    from core.db.session import get_sync_sessionmaker
+
+    scraped_at = time.time()
+    payload = {
+        'city': city.strip(),
+        'deal_type': deal_type,
+        'rooms': segment_rooms(rooms),
+        'scraped_at': scraped_at,
+        'listings': listings,
+    }
+
+    get_sync_redis().set(
+        segment_key(city, deal_type, rooms),
+        json.dumps(payload, ensure_ascii=False),
+        ex=ANALOG_SNAPSHOT_MAX_AGE,
+    )
+
+    try:
+        with get_sync_sessionmaker()() as session:
+            session.add(MarketSnapshot(id=str(uuid.uuid4()), source='cian', snapshot=payload))
+            session.commit()
+    except Exception:
+        logger.warning("Не удалось сохранить снапшот в БД city=%s deal_type=%s rooms=%s",
+                       city, deal_type, rooms, exc_info=True)
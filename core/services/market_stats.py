@@ -0,0 +1,163 @@
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from core.db.models import MarketSegmentStats
+from core.db.session import AsyncSessionLocal, get_sync_sessionmaker
+from core.services.analog_batch import trim_outliers_iqr
+from core.services.analog_cache import TTLCache, area_bucket
+from core.services.market_snapshots import segment_rooms
+
+logger = logging.getLogger(__name__)
+
+# Допустимые цены объявления по типу сделки (остальное — мусор или ошибки парсинга)
+PRICE_RANGES = {
+    'rent': (8000, 500000),
+    'sale': (1000000, 50000000),
+}
+
+SEGMENT_STATS_AREA_STEP = float(os.getenv("SEGMENT_STATS_AREA_STEP", "0.1"))
+SEGMENT_STATS_MIN_OFFERS = int(os.getenv("SEGMENT_STATS_MIN_OFFERS", "5"))
+SEGMENT_STATS_MAX_AGE = int(os.getenv("SEGMENT_STATS_MAX_AGE", "86400"))  # секунды
+SEGMENT_STATS_WINDOW = int(os.getenv("SEGMENT_STATS_WINDOW", str(30 * 86400)))  # окно наблюдений
+SEGMENT_STATS_MAX_SAMPLES = int(os.getenv("SEGMENT_STATS_MAX_SAMPLES", "500"))
+# Локальный кэш результатов поиска (в том числе отсутствующих сегментов)
+SEGMENT_STATS_CACHE_TTL = int(os.getenv("SEGMENT_STATS_CACHE_TTL", "60"))
+# Сколько прогноз ждет статистику сегмента, прежде чем перейти к поиску аналогов
+SEGMENT_STATS_LOOKUP_TIMEOUT = float(os.getenv("SEGMENT_STATS_LOOKUP_TIMEOUT", "0.2"))  # секунды
+
+_lookup_cache = TTLCache(max_entries=4096, ttl=SEGMENT_STATS_CACHE_TTL)
+
+
+def stats_bucket(area: float) -> int:
+    return area_bucket(area, SEGMENT_STATS_AREA_STEP)
+
+
+def _sample_key(listing: Dict[str, Any]) -> str:
+    return listing.get('url') or f"{listing.get('address', '')}|{listing.get('price')}|{listing.get('area_total')}"
+
+
+def _percentiles(samples: Dict[str, List[float]]) -> Dict[str, Optional[float]]:
+    """Перцентили цены за м² после IQR-отсечения выбросов"""
+    arr = trim_outliers_iqr(np.array([v[0] for v in samples.values()], dtype=float))
+    if not len(arr):
+        return {'p25_price_m2': None, 'p50_price_m2': None, 'p75_price_m2': None, 'offers_count': 0}
+    p25, p50, p75 = np.percentile(arr, [25, 50, 75])
+    return {
+        'p25_price_m2': float(p25),
+        'p50_price_m2': float(p50),
+        'p75_price_m2': float(p75),
+        'offers_count': int(len(arr)),
+    }
+
+
+def update_segment_stats(city: str, deal_type: str, rooms: int, listings: List[Dict[str, Any]]) -> int:
+    """
+    Инкрементально обновляет статистику сегментов по новым объявлениям (из воркера).
+    Возвращает количество обновленных корзин площади
+    """
+    lo, hi = PRICE_RANGES[deal_type]
+    now = time.time()
+    by_bucket: Dict[int, Dict[str, List[float]]] = {}
+    for listing in listings:
+        price = listing.get('price')
+        area = listing.get('area_total')
+        if not price or not area or not (lo <= float(price) <= hi):
+            continue
+        bucket = by_bucket.setdefault(stats_bucket(area), {})
+        bucket[_sample_key(listing)] = [float(price) / float(area), now]
+
+    if not by_bucket:
+        return 0
+
+    city_key = city.strip().casefold()
+    rooms = segment_rooms(rooms)
+    with get_sync_sessionmaker()() as session:
+        # Корзины по порядку: пересекающиеся обновления сегмента берут блокировки одинаково
+        for bucket, fresh in sorted(by_bucket.items()):
+            # Строка создается заранее и без гонки: иначе FOR UPDATE нечего блокировать,
+            # и два одновременных обновления нового сегмента оба делают INSERT
+            session.execute(
+                pg_insert(MarketSegmentStats.__table__)
+                .values(
+                    id=str(uuid.uuid4()), city=city_key, deal_type=deal_type, rooms=rooms,
+                    area_bucket=bucket, offers_count=0, samples={},
+                )
+                .on_conflict_do_nothing(index_elements=['city', 'deal_type', 'rooms', 'area_bucket'])
+            )
+            row = session.execute(
+                select(MarketSegmentStats)
+                .where(
+                    MarketSegmentStats.city == city_key,
+                    MarketSegmentStats.deal_type == deal_type,
+                    MarketSegmentStats.rooms == rooms,
+                    MarketSegmentStats.area_bucket == bucket,
+                )
+                .with_for_update()
+            ).scalar_one()
+
+            # Окно: старые наблюдения + новые, без устаревших и не больше MAX_SAMPLES самых свежих
+            samples = dict(row.samples or {})
+            samples.update(fresh)
+            samples = {k: v for k, v in samples.items() if now - v[1] <= SEGMENT_STATS_WINDOW}
+            if len(samples) > SEGMENT_STATS_MAX_SAMPLES:
+                newest = sorted(samples.items(), key=lambda kv: kv[1][1], reverse=True)
+                samples = dict(newest[:SEGMENT_STATS_MAX_SAMPLES])
+
+            row.samples = samples
+            for field, value in _percentiles(samples).items():
+                setattr(row, field, value)
+            row.updated_at = datetime.now(timezone.utc)
+        session.commit()
+    return len(by_bucket)
+
+
+async def get_segment_stats(city: str, deal_type: str, rooms: int, area: float) -> Optional[Dict[str, Any]]:
+    """Статистика сегмента одним индексированным запросом (с коротким локальным кэшем)"""
+    key = (city.strip().casefold(), deal_type, segment_rooms(rooms), stats_bucket(area))
+    cached = _lookup_cache.get(key)
+    if cached is not None:
+        return cached[0]
+
+    city_key, deal_type, rooms, bucket = key
+    stats = None
+    try:
+        async with AsyncSessionLocal() as session:
+            row = (await session.execute(
+                select(
+                    MarketSegmentStats.offers_count,
+                    MarketSegmentStats.p25_price_m2,
+                    MarketSegmentStats.p50_price_m2,
+                    MarketSegmentStats.p75_price_m2,
+                    MarketSegmentStats.updated_at,
+                ).where(
+                    MarketSegmentStats.city == city_key,
+                    MarketSegmentStats.deal_type == deal_type,
+                    MarketSegmentStats.rooms == rooms,
+                    MarketSegmentStats.area_bucket == bucket,
+                )
+            )).one_or_none()
+    except Exception:
+        logger.warning("Не удалось прочитать статистику сегмента %s", key, exc_info=True)
+        # Недоступную БД не опрашиваем на каждом запросе
+        _lookup_cache.set(key, (None,))
+        return None
+
+    fresh_after = datetime.now(timezone.utc) - timedelta(seconds=SEGMENT_STATS_MAX_AGE)
+    if (row is not None and row.p50_price_m2 is not None
+            and row.offers_count >= SEGMENT_STATS_MIN_OFFERS and row.updated_at >= fresh_after):
+        stats = {
+            'offers_count': row.offers_count,
+            'p25_price_m2': row.p25_price_m2,
+            'p50_price_m2': row.p50_price_m2,
+            'p75_price_m2': row.p75_price_m2,
+        }
+    _lookup_cache.set(key, (stats,))
+    return stats
@@ -0,0 +1,157 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram, generate_latest
+
+# Метрики процесса. Экспортируются через GET /metrics в формате Prometheus
+
+DB_POOL_SIZE = Gauge("axiomly_db_pool_size", "Размер пула соединений БД")
+DB_POOL_CHECKED_OUT = Gauge("axiomly_db_pool_checked_out", "Соединения БД, выданные запросам")
+DB_POOL_CHECKED_IN = Gauge("axiomly_db_pool_checked_in", "Свободные соединения БД в пуле")
+DB_POOL_OVERFLOW = Gauge("axiomly_db_pool_overflow", "Соединения БД сверх pool_size")
+DB_POOL_WAIT = Histogram(
+    "axiomly_db_pool_wait_seconds",
+    "Ожидание соединения из пула БД (включая открытие нового)",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_POOL_TIMEOUTS = Counter("axiomly_db_pool_timeouts_total", "Запросы, не дождавшиеся соединения БД")
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "axiomly_http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ['method', 'route', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+# Этапы /api/predict: от микросекунд (смешивание) до секунд (загрузка страниц CIAN)
+STAGE_SECONDS = Histogram(
+    "axiomly_stage_duration_seconds",
+    "Время этапа обработки прогноза",
+    ['stage'],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+CIAN_PAGE_OUTCOMES = Counter(
+    "axiomly_cian_page_outcomes_total",
+    "Результаты загрузки страниц выдачи CIAN",
+    ['outcome'],
+)
+
+ANALOG_SOURCE_OUTCOMES = Counter(
+    "axiomly_analog_source_outcomes_total",
+    "Результаты опроса источников аналогов",
+    ['source', 'outcome'],
+)
+
+CIAN_RATE_LIMIT = Gauge("axiomly_cian_rate_limit", "Текущая разрешенная частота запросов к CIAN, страниц в секунду")
+CIAN_BREAKER_STATE = Gauge("axiomly_cian_breaker_state", "Цепь запросов к CIAN: 0 — замкнута, 1 — проба, 2 — разомкнута")
+
+PREDICT_ANALOGS_STATUS = Counter(
+    "axiomly_predict_analogs_status_total",
+    "Откуда взяты рыночные данные прогноза: ok — успели, stale — устаревший кэш, skipped — только модель",
+    ['status'],
+)
+
+# В процессе-воркере пула замеры копятся здесь и возвращаются родителю вместе с результатом
+_collected: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("collected_stages", default=None)
+_stage_children: Dict[str, Any] = {}
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    collected = _collected.get()
+    if collected is not None:
+        collected.append((stage, seconds))
+        return
+    child = _stage_children.get(stage)
+    if child is None:
+        child = _stage_children[stage] = STAGE_SECONDS.labels(stage)
+    child.observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Замер этапа: with stage_timer('model_predict'): ..."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def collect_stages(fn: Callable, *args) -> Tuple[Any, List[Tuple[str, float]]]:
+    """Выполняет fn, собирая замеры этапов вместо записи в метрики (для процессов-воркеров)"""
+    token = _collected.set([])
+    try:
+        result = fn(*args)
+        return result, _collected.get()
+    finally:
+        _collected.reset(token)
+
+
+def observe_stages(timings: List[Tuple[str, float]]) -> None:
+    for stage, seconds in timings:
+        observe_stage(stage, seconds)
+
+
+def count_cian_outcome(outcome: str) -> None:
+    CIAN_PAGE_OUTCOMES.labels(outcome).inc()
+
+
+def count_source_outcome(source: str, outcome: str) -> None:
+    ANALOG_SOURCE_OUTCOMES.labels(source, outcome).inc()
+
+
+def count_analogs_status(status: str) -> None:
+    PREDICT_ANALOGS_STATUS.labels(status).inc()
+
+
+class RequestTimingMiddleware:
+    """
+    ASGI-middleware: время запроса по шаблону маршрута и отметка начала в request.state
+    (по ней обработчик считает время разбора и валидации тела)
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Dict[Any, str] = {}
+
+    def _route_path(self, scope) -> str:
+        """Шаблон пути по обработчику, а не сам путь: иначе метка растет без ограничений"""
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return 'unmatched'
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            for route in scope['app'].routes:
+                if getattr(route, 'endpoint', getattr(route, 'app', None)) is endpoint:
+                    path = route.path
+                    break
+            path = self._route_paths[endpoint] = path or 'unmatched'
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        scope.setdefault('state', {})['started_at'] = started
+        status = {'code': 500}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(
+                scope['method'], self._route_path(scope), str(status['code'])
+            ).observe(time.perf_counter() - started)
+
+
+def render_metrics() -> bytes:
+    return generate_latest()
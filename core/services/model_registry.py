@@ -1,39 +1,301 @@
-import joblib
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Set, Tuple
+
+import joblib
+
+logger = logging.getLogger(__name__)
+
+# 1 — модели загружаются при первом прогнозе, а не при старте
+MODEL_LAZY_LOAD = os.getenv("MODEL_LAZY_LOAD", "0") == "1"
+# Период проверки папки моделей на новые версии; 0 — не следить
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "30"))  # секунды
+
+# Файл без версии (sale_model.joblib) — самая старая версия
+LEGACY_VERSION = "legacy"
+_ARTIFACT_RE = re.compile(r'^(sale|rent)_model(?:-([0-9A-Za-z_]+))?\.(cbm|joblib)$')
+# Форматы артефактов по убыванию предпочтения: их пишет обучение и в этом порядке
+# выбирает загрузка (прочие найденные — после них). joblib загружается быстрее и
+# занимает меньше памяти (bench_model_formats); cbm не исполняет pickle при загрузке
+FORMAT_PRIORITY = tuple(
+    f.strip() for f in os.getenv("MODEL_FORMATS", "joblib").split(",") if f.strip() in ('cbm', 'joblib')
+) or ('joblib',)
+
+# Синтетический объект для прогрева новой версии перед переключением
+WARMUP_INPUT = {
+    'region': 'Москва',
+    'city': 'Москва',
+    'building_type': '1',
+    'object_type': '1',
+    'level': 5,
+    'levels': 9,
+    'rooms': 2,
+    'area': 54.0,
+    'kitchen_area': 9.0,
+}
+
+
+def new_version() -> str:
+    """Версия артефакта — время обучения в UTC, сортируется как строка"""
+    return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+
+
+def _version_order(version: str) -> Tuple[bool, str]:
+    return version != LEGACY_VERSION, version
+
+
+def _format_rank(fmt: str) -> int:
+    return FORMAT_PRIORITY.index(fmt) if fmt in FORMAT_PRIORITY else len(FORMAT_PRIORITY)
+
+
+def discover_artifacts(models_dir: str) -> Dict[str, Dict[str, Path]]:
+    """Версии моделей в папке: тип сделки -> {версия: путь} в формате по FORMAT_PRIORITY"""
+    found: Dict[str, Dict[str, Path]] = {}
+    if not Path(models_dir).is_dir():
+        return found
+    for path in Path(models_dir).iterdir():
+        match = _ARTIFACT_RE.match(path.name)
+        if not match:
+            continue
+        deal_type, version, fmt = match.group(1), match.group(2) or LEGACY_VERSION, match.group(3)
+        versions = found.setdefault(deal_type, {})
+        known = versions.get(version)
+        if known is None or _format_rank(fmt) < _format_rank(known.suffix[1:]):
+            versions[version] = path
+    return found
+
+
+def latest_version(versions) -> str:
+    return max(versions, key=_version_order)
+
+
+def save_model_artifact(
+    model,
+    deal_type: str,
+    models_dir: str = 'models',
+    version: Optional[str] = None,
+    formats: Sequence[str] = FORMAT_PRIORITY
+) -> Path:
+    """
+    Сохраняет обученную модель новой версией (из sale_model.py / rent_model.py)
+    в каждом из форматов formats. Возвращает путь в первом из них
+    """
+    version = version or new_version()
+    models_path = Path(models_dir)
+    models_path.mkdir(parents=True, exist_ok=True)
+    stem = f"{deal_type}_model-{version}"
+
+    paths = []
+    for fmt in formats:
+        # Сначала во временный файл: наблюдатель не должен увидеть недописанную модель
+        path = models_path / f"{stem}.{fmt}"
+        tmp_path = models_path / f".{stem}.{fmt}.tmp"
+        if fmt == 'cbm':
+            model.save_model(str(tmp_path), format='cbm')
+        else:
+            joblib.dump({'model': model, 'version': version}, tmp_path)
+        os.replace(tmp_path, path)
+        paths.append(path)
+    return paths[0]
+
+
+def _load_artifact(path: Path):
+    if path.suffix == '.cbm':
+        from catboost import CatBoostRegressor
+        try:
+            model = CatBoostRegressor()
+            model.load_model(str(path), format='cbm')
+            return model
+        except Exception:
+            fallback = path.with_suffix('.joblib')
+            if not fallback.exists():
+                raise
+            logger.warning("Не удалось загрузить %s, используется %s", path, fallback.name, exc_info=True)
+            path = fallback
+    return joblib.load(path)['model']
+
+
+class LoadedModel:
+    """Одна версия модели. Проксирует predict, загружается при первом обращении"""
+
+    def __init__(self, deal_type: str, version: str, path: Path):
+        self.deal_type = deal_type
+        self.version = version
+        self.path = path
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    self._model = _load_artifact(self.path)
+                    logger.info("Модель %s версии %s загружена за %.2f с",
+                                self.deal_type, self.version, time.perf_counter() - started)
+        return self._model
+
+    def unload(self) -> None:
+        with self._lock:
+            self._model = None
+
+    def predict(self, data):
+        return self.load().predict(data)
+
+    def warm_up(self) -> float:
+        """Пробный прогноз: первый predict CatBoost заметно дольше последующих"""
+        from predict_price import RENT_ENCODER, SALE_ENCODER
+        # Мимо predict_ml_price: синтетический прогноз не должен попадать в метрики этапов
+        encoder = SALE_ENCODER if self.deal_type == 'sale' else RENT_ENCODER
+        return float(self.load().predict([encoder.encode(WARMUP_INPUT)])[0])
 
 
 class ModelRegistry:
-    def __init__(self):
-        self.models = {}
+    """
+    Активные версии моделей по типу сделки. Новая версия загружается и прогревается
+    в стороне, затем подменяет старую одним присваиванием — запросы видят одну из двух.
+    versions_only — реестр родителя пула процессов: прогнозы считают воркеры, поэтому
+    артефакт только проверяется загрузкой и сразу выгружается
+    """
+
+    def __init__(self, models_dir: Optional[str] = None, lazy: bool = False, versions_only: bool = False):
+        self.models_dir = models_dir
+        self.lazy = lazy and not versions_only
+        self.versions_only = versions_only
+        self.models: Dict[str, LoadedModel] = {}
         self.encoders = {}
+        self._swap_lock = threading.Lock()
+        self._failed: Set[Tuple[str, str]] = set()
+        self._watch_task: Optional[asyncio.Task] = None
 
     @classmethod
-    def load_from_disk(cls, models_dir: str):
-        """Загружает модели из папки при старте приложения"""
-        registry = cls()
-        models_path = Path(models_dir)
-
-        # Загружаем модель продажи
-        sale_path = models_path / "sale_model.joblib"
-        if sale_path.exists():
-            data = joblib.load(sale_path)
-            registry.models['sale'] = data['model']
-            print("✓ Модель продажи загружена")
-        else:
-            print("✗ Модель продажи не найдена")
-
-        # Загружаем модель аренды
-        rent_path = models_path / "rent_model.joblib"
-        if rent_path.exists():
-            data = joblib.load(rent_path)
-            registry.models['rent'] = data['model']
-            print("✓ Модель аренды загружена")
-        else:
-            print("✗ Модель аренды не найдена")
+    def load_from_disk(cls, models_dir: str, lazy: bool = MODEL_LAZY_LOAD, versions_only: bool = False):
+        """Загружает последние версии моделей из папки при старте приложения"""
+        registry = cls(models_dir, lazy, versions_only)
+        lazy = registry.lazy
+        artifacts = discover_artifacts(models_dir)
+
+        for deal_type, title in (('sale', 'продажи'), ('rent', 'аренды')):
+            versions = artifacts.get(deal_type)
+            if not versions:
+                print(f"✗ Модель {title} не найдена")
+                continue
+            # От новых версий к старым: битый последний артефакт не должен мешать старту
+            for version in sorted(versions, key=_version_order, reverse=True):
+                model = LoadedModel(deal_type, version, versions[version])
+                if not lazy:
+                    try:
+                        model.load()
+                    except Exception:
+                        registry._failed.add((deal_type, version))
+                        logger.warning("Модель %s версии %s не загрузилась", deal_type, version, exc_info=True)
+                        continue
+                    if versions_only:
+                        model.unload()
+                registry.models[deal_type] = model
+                print(f"✓ Модель {title} {'найдена' if lazy else 'загружена'} (версия {version})")
+                break
+            else:
+                print(f"✗ Модель {title} не загружена")
 
         return registry
 
-    def get(self, deal_type: str):
-        """Возвращает модель для типа сделки"""
+    def get(self, deal_type: str) -> Optional[LoadedModel]:
+        """Возвращает активную версию модели для типа сделки"""
         model = self.models.get(deal_type)
         return model
+
+    def versions(self) -> Dict[str, Optional[str]]:
+        return {deal_type: model.version for deal_type, model in self.models.items()}
+
+    def activate(self, deal_type: str, version: str, path: Optional[Path] = None, warm_up: bool = True) -> LoadedModel:
+        """Загружает версию, прогревает и делает активной"""
+        current = self.models.get(deal_type)
+        if current is not None and current.version == version:
+            return current
+        if path is None:
+            path = discover_artifacts(self.models_dir).get(deal_type, {}).get(version)
+            if path is None:
+                raise FileNotFoundError(f"Модель {deal_type} версии {version} не найдена в {self.models_dir}")
+
+        model = LoadedModel(deal_type, version, path)
+        model.load()
+        if self.versions_only:
+            # Загрузка только проверила артефакт; прогревают модель воркеры
+            model.unload()
+        elif warm_up:
+            model.warm_up()
+        self.models[deal_type] = model
+        return model
+
+    def follow(self, deal_type: str, version: str) -> Optional[LoadedModel]:
+        """
+        Переключается на версию, выбранную другим процессом. Не загрузившаяся версия
+        запоминается и больше не пробуется, работает текущая
+        """
+        current = self.models.get(deal_type)
+        if (current is not None and current.version == version) or (deal_type, version) in self._failed:
+            return current
+        with self._swap_lock:
+            try:
+                return self.activate(deal_type, version)
+            except Exception:
+                self._failed.add((deal_type, version))
+                logger.warning("Модель %s версии %s не загрузилась, активна %s",
+                               deal_type, version, current.version if current else None, exc_info=True)
+                return current
+
+    def refresh(self) -> Dict[str, str]:
+        """Переключает типы сделок на самые новые версии на диске, возвращает смененные"""
+        swapped = {}
+        with self._swap_lock:
+            for deal_type, versions in discover_artifacts(self.models_dir).items():
+                version = latest_version(versions)
+                current = self.models.get(deal_type)
+                if (current is not None and current.version == version) or (deal_type, version) in self._failed:
+                    continue
+                try:
+                    self.activate(deal_type, version, versions[version])
+                except Exception:
+                    # Битую версию не пробуем снова, работает предыдущая
+                    self._failed.add((deal_type, version))
+                    logger.warning("Модель %s версии %s не загрузилась, активна %s",
+                                   deal_type, version, current.version if current else None, exc_info=True)
+                    continue
+                swapped[deal_type] = version
+                logger.info("Модель %s переключена на версию %s", deal_type, version)
+        return swapped
+
+    async def _watch(self, on_swap: Optional[Callable[[Dict[str, str]], Awaitable[None]]]) -> None:
+        while True:
+            await asyncio.sleep(MODEL_WATCH_INTERVAL)
+            try:
+                swapped = await asyncio.to_thread(self.refresh)
+                if swapped and on_swap is not None:
+                    # Колбэк выполняется в цикле событий; блокирующую работу он сам уносит в поток
+                    await on_swap(swapped)
+            except Exception:
+                logger.warning("Ошибка проверки новых версий моделей", exc_info=True)
+
+    def start_watching(self, on_swap: Optional[Callable[[Dict[str, str]], Awaitable[None]]] = None) -> None:
+        if MODEL_WATCH_INTERVAL > 0 and self.models_dir and self._watch_task is None:
+            self._watch_task = asyncio.get_running_loop().create_task(self._watch(on_swap))
+
+    async def stop_watching(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
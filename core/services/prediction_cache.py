@@ -0,0 +1,63 @@
+import os
+from typing import Any, Dict, Hashable, Optional
+
+from core.services.analog_cache import TTLCache
+
+# Прогноз модели зависит только от признаков и версии — живет долго
+ML_PRICE_CACHE_TTL = int(os.getenv("ML_PRICE_CACHE_TTL", "3600"))  # секунды
+ML_PRICE_CACHE_MAX_ENTRIES = int(os.getenv("ML_PRICE_CACHE_MAX_ENTRIES", "20000"))
+# Итог со смешиванием зависит от рынка — не дольше кэша аналогов
+BLEND_CACHE_TTL = int(os.getenv("BLEND_CACHE_TTL", "300"))  # секунды
+BLEND_CACHE_MAX_ENTRIES = int(os.getenv("BLEND_CACHE_MAX_ENTRIES", "4096"))
+
+
+class PredictionCache:
+    """Кэш прогнозов: отдельно цена модели и итог со смешиванием с рынком"""
+
+    def __init__(self, ml_ttl: int, ml_max_entries: int, blend_ttl: int, blend_max_entries: int):
+        self.ml = TTLCache(ml_max_entries, ml_ttl)
+        self.blend = TTLCache(blend_max_entries, blend_ttl)
+        self.counters = {'ml_hits': 0, 'ml_misses': 0, 'blend_hits': 0, 'blend_misses': 0, 'invalidations': 0}
+
+    def get_ml(self, key: Optional[Hashable]) -> Optional[float]:
+        if key is None:
+            return None
+        value = self.ml.get(key)
+        self.counters['ml_hits' if value is not None else 'ml_misses'] += 1
+        return value
+
+    def set_ml(self, key: Optional[Hashable], value: float) -> None:
+        if key is not None:
+            self.ml.set(key, value)
+
+    def get_blend(self, key: Optional[Hashable]) -> Optional[Any]:
+        if key is None:
+            return None
+        value = self.blend.get(key)
+        self.counters['blend_hits' if value is not None else 'blend_misses'] += 1
+        return value
+
+    def set_blend(self, key: Optional[Hashable], value: Any) -> None:
+        if key is not None:
+            self.blend.set(key, value)
+
+    def invalidate(self, swapped: Optional[Dict[str, str]] = None) -> None:
+        """
+        Сброс при смене версии модели. Версия входит в ключ, поэтому старые записи
+        и так не совпадут — очистка только освобождает память
+        """
+        self.ml.clear()
+        self.blend.clear()
+        self.counters['invalidations'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            'ml_entries': len(self.ml),
+            'blend_entries': len(self.blend),
+        }
+
+
+prediction_cache = PredictionCache(
+    ML_PRICE_CACHE_TTL, ML_PRICE_CACHE_MAX_ENTRIES, BLEND_CACHE_TTL, BLEND_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,35 @@
+import os
+from typing import Any, Dict, Optional
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+_redis = None
+_sync_redis: Dict[str, Any] = {}
+
+
+def get_redis():
+    """Общий асинхронный клиент Redis или None, если REDIS_URL не задан"""
+    global _redis
+    if not REDIS_URL:
+        return None
+    if _redis is None:
+        import redis.asyncio as aioredis
+        _redis = aioredis.from_url(REDIS_URL)
+    return _redis
+
+
+def get_sync_redis(url: Optional[str] = None):
+    """Общий синхронный клиент Redis для фоновых задач (свой пул соединений на адрес)"""
+    url = url or REDIS_URL
+    client = _sync_redis.get(url)
+    if client is None:
+        import redis
+        client = _sync_redis[url] = redis.Redis.from_url(url)
+    return client
+
+
+async def close_redis() -> None:
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
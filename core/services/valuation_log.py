@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from core.db.models import Client, ValuationRequest, ValuationResult
+from core.db.session import engine
+
+logger = logging.getLogger(__name__)
+
+# Включать при доступном Postgres: иначе каждая пачка оценок — ошибка БД в логе
+VALUATION_LOG_ENABLED = os.getenv("VALUATION_LOG_ENABLED", "0") == "1"
+VALUATION_LOG_BATCH_SIZE = int(os.getenv("VALUATION_LOG_BATCH_SIZE", "200"))
+VALUATION_LOG_FLUSH_INTERVAL = float(os.getenv("VALUATION_LOG_FLUSH_INTERVAL", "2"))  # секунды
+# Сверх этого записи отбрасываются: ответ API важнее журнала
+VALUATION_LOG_QUEUE_MAX = int(os.getenv("VALUATION_LOG_QUEUE_MAX", "10000"))
+# Клиент, от имени которого пишутся запросы с сайта и без ключа API
+VALUATION_CLIENT_ID = os.getenv("VALUATION_CLIENT_ID", "00000000-0000-0000-0000-000000000001")
+VALUATION_CLIENT_NAME = os.getenv("VALUATION_CLIENT_NAME", "web")
+
+
+class ValuationWriter:
+    """Журнал оценок с отложенной записью: запрос ставит запись в очередь, пачки пишет фоновая задача"""
+
+    def __init__(self, batch_size: int, flush_interval: float, queue_max: int, enabled: bool = True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_max = queue_max
+        self.enabled = enabled
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._client_ready = False
+        # Собираемая или записываемая пачка: при остановке ее допишет stop()
+        self._pending: List[Tuple[Dict[str, Any], float, Dict[str, Any]]] = []
+        self.counters = {'queued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'batches': 0}
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_max)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def record(self, payload: Dict[str, Any], price: float, details: Dict[str, Any]) -> None:
+        """Ставит оценку в очередь на запись, не ожидая БД"""
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait((payload, price, details))
+        except asyncio.QueueFull:
+            self.counters['dropped'] += 1
+            return
+        self.counters['queued'] += 1
+
+    async def _fill_pending(self) -> None:
+        """Ждет первую запись, затем добирает пачку до batch_size или до истечения интервала"""
+        self._pending.append(await self._queue.get())
+        deadline = time.monotonic() + self.flush_interval
+        while len(self._pending) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                self._pending.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    def _drain(self) -> List[Tuple[Dict[str, Any], float, Dict[str, Any]]]:
+        batch = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            await self._fill_pending()
+            await self._flush(self._pending)
+            self._pending = []
+
+    async def _ensure_client(self, conn) -> None:
+        # Флаг ставит _flush после коммита: при откате строки клиента может не быть
+        if self._client_ready:
+            return
+        await conn.execute(
+            pg_insert(Client.__table__)
+            .values(id=VALUATION_CLIENT_ID, name=VALUATION_CLIENT_NAME)
+            .on_conflict_do_nothing(index_elements=['id'])
+        )
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], float, Dict[str, Any]]]) -> None:
+        if not batch:
+            return
+        requests, results = [], []
+        for payload, price, details in batch:
+            request_id = str(uuid.uuid4())
+            requests.append({'id': request_id, 'client_id': VALUATION_CLIENT_ID, 'payload': payload, 'status': 'done'})
+            results.append({'id': str(uuid.uuid4()), 'request_id': request_id,
+                            'price': int(round(price)), 'details': details})
+        try:
+            async with engine.begin() as conn:
+                await self._ensure_client(conn)
+                # Список параметров -> executemany: asyncpg шлет пачку одним многострочным INSERT
+                await conn.execute(insert(ValuationRequest.__table__), requests)
+                await conn.execute(insert(ValuationResult.__table__), results)
+        except Exception:
+            self.counters['failed'] += len(batch)
+            logger.warning("Не удалось записать %s оценок в БД", len(batch), exc_info=True)
+            return
+        self._client_ready = True
+        self.counters['written'] += len(batch)
+        self.counters['batches'] += 1
+
+    async def stop(self) -> None:
+        """Останавливает фоновую задачу и дописывает все, что осталось в очереди"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        batch = self._pending + self._drain()
+        self._pending = []
+        for i in range(0, len(batch), self.batch_size):
+            await self._flush(batch[i:i + self.batch_size])
+        self._queue = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            'enabled': self.enabled,
+            'queue_size': self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+valuation_writer = ValuationWriter(
+    VALUATION_LOG_BATCH_SIZE, VALUATION_LOG_FLUSH_INTERVAL, VALUATION_LOG_QUEUE_MAX, VALUATION_LOG_ENABLED
+)
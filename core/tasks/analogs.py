@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy.exc import OperationalError
+
+from core.parsers.cian_parser import fetch_cian_listings
+from core.parsers.http_client import close_http_client
+from core.services.listing_store import LISTING_STORE_ENABLED, upsert_listings
+from core.services.market_snapshots import list_registered_segments, segment_rooms, store_snapshot
+from core.services.market_stats import update_segment_stats
+from core.services.redis_client import close_redis
+from core.tasks.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+# Сегменты, которые обновляются всегда, даже если их еще никто не запрашивал
+ANALOG_REFRESH_CITIES = [c.strip() for c in os.getenv("ANALOG_REFRESH_CITIES", "Москва,Санкт-Петербург").split(",") if c.strip()]
+ANALOG_REFRESH_PAGES = int(os.getenv("ANALOG_REFRESH_PAGES", "3"))
+# Ограничение частоты запросов к CIAN со стороны воркеров
+ANALOG_REFRESH_RATE_LIMIT = os.getenv("ANALOG_REFRESH_RATE_LIMIT", "6/m")
+
+
+async def _scrape_segment(city: str, deal_type: str, rooms: int) -> List[Dict[str, Any]]:
+    # Каждый asyncio.run создает новый event loop — пул соединений и клиент Redis
+    # (общее с API ограничение частоты CIAN) закрываем вместе с ним
+    try:
+        return await fetch_cian_listings(
+            location=city,
+            deal_type=deal_type,
+            rooms=rooms,
+            start_page=1,
+            end_page=ANALOG_REFRESH_PAGES,
+        )
+    finally:
+        await close_http_client()
+        await close_redis()
+
+
+@celery_app.task(name="core.tasks.analogs.refresh_segments")
+def refresh_segments():
+    """Ставит в очередь обновление всех известных сегментов"""
+    segments = {
+        (city, deal_type, rooms)
+        for city in ANALOG_REFRESH_CITIES
+        for deal_type in ('sale', 'rent')
+        for rooms in range(0, 5)
+    }
+    try:
+        segments.update(list_registered_segments())
+    except Exception:
+        logger.warning("Не удалось получить востребованные сегменты", exc_info=True)
+
+    for city, deal_type, rooms in sorted(segments):
+        refresh_segment.delay(city, deal_type, rooms)
+    logger.info("Запланировано обновление сегментов: %s", len(segments))
+
+
+@celery_app.task(
+    name="core.tasks.analogs.refresh_segment",
+    rate_limit=ANALOG_REFRESH_RATE_LIMIT,
+    # Недоступность Redis (снапшот) или Postgres (статистика) — повтор с нарастающей паузой
+    autoretry_for=(RedisConnectionError, OperationalError),
+    retry_backoff=True,
+    max_retries=3,
+)
+def refresh_segment(city: str, deal_type: str, rooms: int):
+    """Скрейпит сегмент город/сделка/комнаты и сохраняет снапшот"""
+    rooms = segment_rooms(rooms)
+    listings = asyncio.run(_scrape_segment(city, deal_type, rooms))
+    if not listings:
+        # Пустой результат (капча/блок) не должен затирать предыдущий снапшот
+        logger.info("Пустой результат для сегмента %s/%s/%s, снапшот не обновлен", city, deal_type, rooms)
+        return
+    store_snapshot(city, deal_type, rooms, listings)
+    if LISTING_STORE_ENABLED:
+        try:
+            upsert_listings(city, deal_type, listings)
+        except Exception:
+            logger.warning("Не удалось сохранить объявления сегмента %s/%s/%s", city, deal_type, rooms, exc_info=True)
+    buckets = update_segment_stats(city, deal_type, rooms, listings)
+    logger.info("Снапшот сегмента %s/%s/%s: %s объявлений, корзин статистики: %s",
+                city, deal_type, rooms, len(listings), buckets)
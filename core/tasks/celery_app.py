@@ -0,0 +1,27 @@
+"""
+Celery-приложение для фоновых задач.
+
+Запуск воркера вместе с планировщиком:
+    celery -A core.tasks.celery_app worker -B --loglevel=info
+"""
+import os
+
+from celery import Celery
+
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+ANALOG_REFRESH_INTERVAL = int(os.getenv("ANALOG_REFRESH_INTERVAL", "3600"))  # секунды
+
+celery_app = Celery("axiomly", broker=CELERY_BROKER_URL, include=["core.tasks.analogs"])
+
+celery_app.conf.update(
+    task_ignore_result=True,
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+    timezone="Europe/Moscow",
+    beat_schedule={
+        "refresh-analog-segments": {
+            "task": "core.tasks.analogs.refresh_segments",
+            "schedule": ANALOG_REFRESH_INTERVAL,
+        },
+    },
+)
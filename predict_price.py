@@ -1,8 +1,28 @@
-from typing import Dict, Any, List, Tuple
+import asyncio
+import logging
+import os
+import time
+from operator import itemgetter
+from typing import Dict, Any, Callable, List, Optional, Set, Tuple
 import numpy as np
 import pandas as pd
 
-from core.parsers.analogs_provider import get_analogs
+from core.parsers.analogs_provider import finish_in_background, get_analogs, get_stale_analogs
+from core.services.analog_batch import AnalogBatch, trim_outliers_iqr
+from core.services.executor import compute_executor
+from core.services.market_stats import PRICE_RANGES, SEGMENT_STATS_LOOKUP_TIMEOUT, get_segment_stats
+from core.services.metrics import count_analogs_status, stage_timer
+from core.services.prediction_cache import prediction_cache
+
+logger = logging.getLogger(__name__)
+
+# Сколько уникальных поисков аналогов выполняется одновременно в пакетном прогнозе
+ANALOG_BATCH_CONCURRENCY = int(os.getenv("ANALOG_BATCH_CONCURRENCY", "8"))
+# Бюджет времени на /api/predict от начала запроса; не успевшие аналоги заменяются кэшем
+# или пропускаются, загрузка продолжается в фоне. 0 — ждать аналоги без ограничения
+PREDICT_DEADLINE = float(os.getenv("PREDICT_DEADLINE", "5"))  # секунды
+# То же для /api/predict/batch: пакет клиент ждет целиком, поэтому по умолчанию без дедлайна
+PREDICT_BATCH_DEADLINE = float(os.getenv("PREDICT_BATCH_DEADLINE", "0"))  # секунды
 
 SALE_FEATURES = [
     'region_name', 'building_type', 'object_type', 'level', 'levels',
@@ -18,13 +38,9 @@ RENT_FEATURES = [
 def filter_outliers_iqr(prices: List[float]) -> List[float]:
     if len(prices) < 3:
         return prices
-    arr = np.array(prices)
-    q1 = np.percentile(arr, 25)
-    q3 = np.percentile(arr, 75)
-    iqr = q3 - q1
-    return arr[(arr >= q1 - 1.5 * iqr) & (arr <= q3 + 1.5 * iqr)].tolist()
+    return trim_outliers_iqr(np.array(prices)).tolist()
 
-def prepare_sale_input(input_data: Dict[str, Any]) -> pd.DataFrame:
+def _sale_row(input_data: Dict[str, Any]) -> Dict[str, Any]:
     d = dict(input_data)
 
     d['region_name'] = str(d.get('region', 'unknown'))
@@ -39,7 +55,11 @@ def prepare_sale_input(input_data: Dict[str, Any]) -> pd.DataFrame:
     d['room_size'] = area / (0.5 if rooms_num == 0 else max(rooms_num, 0.5))
     d['floor_ratio'] = level / levels
 
-    X = pd.DataFrame([{k: d.get(k, 0) for k in SALE_FEATURES}])
+    return {k: d.get(k, 0) for k in SALE_FEATURES}
+
+def prepare_sale_inputs(items: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Матрица признаков продажи для нескольких объектов сразу"""
+    X = pd.DataFrame([_sale_row(d) for d in items], columns=SALE_FEATURES)
 
     # Признаки должны быть строками
     for col in ['region_name', 'building_type', 'object_type', 'rooms']:
@@ -47,7 +67,10 @@ def prepare_sale_input(input_data: Dict[str, Any]) -> pd.DataFrame:
 
     return X
 
-def prepare_rent_input(input_data: Dict[str, Any]) -> pd.DataFrame:
+def prepare_sale_input(input_data: Dict[str, Any]) -> pd.DataFrame:
+    return prepare_sale_inputs([input_data])
+
+def _rent_row(input_data: Dict[str, Any]) -> Dict[str, Any]:
     d = dict(input_data)
 
     building_type_mapping = {'0':'unknown','1':'panel','2':'monolithic','3':'brick','4':'block','5':'wood'}
@@ -79,45 +102,276 @@ def prepare_rent_input(input_data: Dict[str, Any]) -> pd.DataFrame:
             row[k] = str(d.get(k, 'unknown'))
         else:
             row[k] = float(d.get(k, 0) or 0)
-    return pd.DataFrame([row])
+    return row
+
+def prepare_rent_inputs(items: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Матрица признаков аренды для нескольких объектов сразу"""
+    return pd.DataFrame([_rent_row(d) for d in items], columns=RENT_FEATURES)
+
+def prepare_rent_input(input_data: Dict[str, Any]) -> pd.DataFrame:
+    return prepare_rent_inputs([input_data])
+
+class FeatureEncoder:
+    """
+    Строит строку признаков в порядке модели без pandas.
+    CatBoost принимает список значений напрямую, результат совпадает с DataFrame-путем
+    """
+
+    def __init__(self, features: List[str], row_builder: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        self.features = tuple(features)
+        self._row_builder = row_builder
+        self._project = itemgetter(*self.features)
+
+    def encode(self, input_data: Dict[str, Any]) -> List[Any]:
+        return list(self._project(self._row_builder(input_data)))
+
+SALE_ENCODER = FeatureEncoder(SALE_FEATURES, _sale_row)
+RENT_ENCODER = FeatureEncoder(RENT_FEATURES, _rent_row)
+
+def predict_ml_price(input_data: Dict[str, Any], deal_type: str, model) -> float:
+    """Прогноз цены моделью без учета аналогов (быстрый путь для одного объекта)"""
+    with stage_timer('feature_prep'):
+        row = (SALE_ENCODER if deal_type == 'sale' else RENT_ENCODER).encode(input_data)
+    with stage_timer('model_predict'):
+        prediction = model.predict([row])[0]
+    if deal_type == 'sale':
+        return float(prediction)
+    return float(np.expm1(prediction))
+
+def predict_ml_prices(items: List[Dict[str, Any]], deal_type: str, model) -> List[float]:
+    """Прогноз модели для пачки объектов одним вызовом predict"""
+    with stage_timer('feature_prep'):
+        X = prepare_sale_inputs(items) if deal_type == 'sale' else prepare_rent_inputs(items)
+    with stage_timer('model_predict'):
+        predictions = model.predict(X)
+    if deal_type == 'sale':
+        return [float(p) for p in predictions]
+    return [float(p) for p in np.expm1(predictions)]
+
+def ml_cache_key(input_data: Dict[str, Any], deal_type: str, model) -> Optional[Tuple]:
+    """Ключ прогноза модели: версия и вектор признаков в порядке модели"""
+    version = getattr(model, 'version', None)
+    if version is None:
+        return None
+    encoder = SALE_ENCODER if deal_type == 'sale' else RENT_ENCODER
+    return (deal_type, version, tuple(encoder.encode(input_data)))
+
+def blend_cache_key(ml_key: Optional[Tuple], input_data: Dict[str, Any]) -> Optional[Tuple]:
+    """Ключ итоговой цены: к признакам добавляются параметры поиска рыночных данных"""
+    if ml_key is None:
+        return None
+    return (ml_key, input_data['city'], int(input_data['rooms']), float(input_data['area']))
 
-def predict_with_analogs(
+def analogs_median_price(analogs: List[Dict[str, Any]], deal_type: str) -> Optional[float]:
+    """Медиана цен аналогов после отсечения мусора и выбросов"""
+    lo, hi = PRICE_RANGES[deal_type]
+    prices = trim_outliers_iqr(AnalogBatch.from_listings(analogs).prices_between(lo, hi))
+    if not len(prices):
+        return None
+    return float(np.median(prices))
+
+def blend_price(ml_price: float, market_price: Optional[float], deal_type: str) -> float:
+    """Смешивает прогноз модели с рыночной ценой"""
+    if market_price is None:
+        return float(ml_price)
+    w_ml, w_analog = (0.3, 0.7) if deal_type == 'rent' else (0.2, 0.8)
+    return float(ml_price * w_ml + market_price * w_analog)
+
+async def get_market_reference(
+    city: str,
+    deal_type: str,
+    rooms: int,
+    area: float
+) -> Tuple[Optional[float], List[Dict[str, Any]]]:
+    """
+    Рыночная цена и аналоги для смешивания. Если есть статистика сегмента,
+    цена берется из нее, а аналоги — только из снапшота, без живого скрейпа
+    """
+    with stage_timer('market_stats'):
+        stats_task = asyncio.ensure_future(get_segment_stats(city, deal_type, rooms, area))
+        try:
+            stats = await asyncio.wait_for(asyncio.shield(stats_task), SEGMENT_STATS_LOOKUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Медленная БД не задерживает поиск аналогов; запрос дорабатывает и заполнит кэш статистики
+            finish_in_background(stats_task)
+            stats = None
+    if stats is not None:
+        with stage_timer('analogs'):
+            analogs = await get_analogs(city=city, deal_type=deal_type, rooms=rooms, area=area, live=False)
+        return stats['p50_price_m2'] * area, analogs
+
+    with stage_timer('analogs'):
+        analogs = await get_analogs(city=city, deal_type=deal_type, rooms=rooms, area=area)
+    with stage_timer('outlier_filter'):
+        market_price = analogs_median_price(analogs, deal_type) if analogs else None
+    return market_price, analogs
+
+async def await_market_reference(
+    task: asyncio.Task,
+    city: str,
+    deal_type: str,
+    rooms: int,
+    area: float,
+    deadline: Optional[float]
+) -> Tuple[Optional[float], List[Dict[str, Any]], str]:
+    """
+    Ждет рыночные данные до дедлайна (time.perf_counter). Не успели — аналоги из
+    устаревшего кэша ('stale') или только модель ('skipped'), загрузка идет в фоне
+    """
+    if deadline is None:
+        market_price, analogs = await task
+        return market_price, analogs, 'ok'
+    # Отмененная загрузка (пакет снял ее до старта) сразу идет по пути без аналогов
+    if not task.cancelled():
+        try:
+            # shield: по таймауту отменяется только ожидание, не сама загрузка
+            market_price, analogs = await asyncio.wait_for(
+                asyncio.shield(task), max(deadline - time.perf_counter(), 0)
+            )
+            return market_price, analogs, 'ok'
+        except asyncio.TimeoutError:
+            finish_in_background(task)
+
+    analogs = get_stale_analogs(city, deal_type, rooms, area)
+    if not analogs:
+        return None, [], 'skipped'
+    with stage_timer('outlier_filter'):
+        market_price = analogs_median_price(analogs, deal_type)
+    return market_price, analogs, 'stale'
+
+async def predict_with_analogs(
     input_data: Dict[str, Any],
     deal_type: str,
-    model
-) -> Tuple[float, float, List[Dict[str, Any]]]:
+    model,
+    deadline: Optional[float] = None
+) -> Tuple[float, float, List[Dict[str, Any]], str]:
+    """
+    Прогноз модели, смешанный с рынком. Возвращает (цена, цена модели, аналоги, статус
+    аналогов): 'ok', 'stale' или 'skipped', если аналоги не успели к дедлайну
+    """
+    ml_key = ml_cache_key(input_data, deal_type, model)
+    blend_key = blend_cache_key(ml_key, input_data)
+    cached = prediction_cache.get_blend(blend_key)
+    if cached is not None:
+        count_analogs_status(cached[3])
+        return cached
 
-    if deal_type == 'sale':
-        X = prepare_sale_input(input_data)
-        ml_price = float(model.predict(X)[0])
-    else:
-        X = prepare_rent_input(input_data)
-        ml_price = float(np.expm1(model.predict(X)[0]))
-
-    analogs = get_analogs(
-        city=input_data['city'],
+    city, rooms, area = input_data['city'], int(input_data['rooms']), float(input_data['area'])
+    # Рыночные данные загружаются параллельно с инференсом модели
+    market_task = asyncio.ensure_future(get_market_reference(
+        city=city,
         deal_type=deal_type,
-        rooms=int(input_data['rooms']),
-        area=float(input_data['area']),
+        rooms=rooms,
+        area=area,
+    ))
+    try:
+        ml_price = prediction_cache.get_ml(ml_key)
+        if ml_price is None:
+            with stage_timer('ml_inference'):
+                ml_price = (await compute_executor.predict([input_data], deal_type, model))[0]
+            prediction_cache.set_ml(ml_key, ml_price)
+    except BaseException:
+        # Не отменяем: загрузку могут ждать другие запросы, а результат пригодится кэшу
+        finish_in_background(market_task)
+        raise
+    market_price, analogs, status = await await_market_reference(
+        market_task, city, deal_type, rooms, area, deadline
     )
+    count_analogs_status(status)
+
+    with stage_timer('blend'):
+        final_price = blend_price(ml_price, market_price, deal_type)
+    result = (float(final_price), float(ml_price), analogs, status)
+    # Без свежих рыночных данных (капча, пустая выдача, дедлайн) итог не кэшируем — это может быть временно
+    if market_price is not None and status == 'ok':
+        prediction_cache.set_blend(blend_key, result)
+    return result
+
+async def predict_batch_with_analogs(
+    inputs: List[Dict[str, Any]],
+    models: Dict[str, Any],
+    deadline: Optional[float] = None
+) -> List[Tuple[float, float, List[Dict[str, Any]], str]]:
+    """
+    Пакетный прогноз: один predict на тип сделки для уникальных векторов признаков
+    без кэша и один поиск аналогов на каждый уникальный набор параметров поиска
+    """
+    results: List[Tuple[float, float, List[Dict[str, Any]], str]] = [None] * len(inputs)
+    ml_prices: List[float] = [0.0] * len(inputs)
+    blend_keys: List[Optional[Tuple]] = [None] * len(inputs)
+    # тип сделки -> ключ признаков -> индексы объектов с этим вектором
+    by_deal_type: Dict[str, Dict[Any, List[int]]] = {}
+    by_search: Dict[Tuple[str, str, int, float], List[int]] = {}
+    for i, d in enumerate(inputs):
+        deal_type = d['deal_type']
+        ml_key = ml_cache_key(d, deal_type, models[deal_type])
+        blend_keys[i] = blend_cache_key(ml_key, d)
+        cached = prediction_cache.get_blend(blend_keys[i])
+        if cached is not None:
+            count_analogs_status(cached[3])
+            results[i] = cached
+            continue
+
+        ml_price = prediction_cache.get_ml(ml_key)
+        if ml_price is not None:
+            ml_prices[i] = ml_price
+        else:
+            # Одинаковые объекты в пакете считаем один раз
+            by_deal_type.setdefault(deal_type, {}).setdefault(ml_key if ml_key is not None else i, []).append(i)
+        search_key = (d['city'], deal_type, int(d['rooms']), float(d['area']))
+        by_search.setdefault(search_key, []).append(i)
+
+    async def run_model(deal_type: str, groups: Dict[Any, List[int]]) -> None:
+        group_items = list(groups.items())
+        prices = await compute_executor.predict(
+            [inputs[idx[0]] for _, idx in group_items], deal_type, models[deal_type]
+        )
+        for (ml_key, idx), price in zip(group_items, prices):
+            # Целый ключ — индекс объекта, модель без версии не кэшируется
+            if not isinstance(ml_key, int):
+                prediction_cache.set_ml(ml_key, price)
+            for i in idx:
+                ml_prices[i] = price
+
+    semaphore = asyncio.Semaphore(ANALOG_BATCH_CONCURRENCY)
+    # Поиски, дождавшиеся семафора: только их имеет смысл доводить в фоне
+    started: Set[Tuple[str, str, int, float]] = set()
+
+    async def fetch_analogs(search_key: Tuple[str, str, int, float]) -> Tuple[Optional[float], List[Dict[str, Any]]]:
+        city, deal_type, rooms, area = search_key
+        async with semaphore:
+            started.add(search_key)
+            try:
+                return await get_market_reference(city=city, deal_type=deal_type, rooms=rooms, area=area)
+            except Exception:
+                logger.warning("Ошибка получения аналогов для %s", search_key, exc_info=True)
+                return None, []
+
+    market_tasks = {search_key: asyncio.ensure_future(fetch_analogs(search_key)) for search_key in by_search}
+
+    def cancel_queued() -> None:
+        # Не начатые поиски отменяем: в фоне они заняли бы семафор уже после ответа
+        for search_key, task in market_tasks.items():
+            if search_key not in started:
+                task.cancel()
+
+    try:
+        await asyncio.gather(*(run_model(deal_type, groups) for deal_type, groups in by_deal_type.items()))
+    except BaseException:
+        cancel_queued()
+        for task in market_tasks.values():
+            finish_in_background(task)
+        raise
 
-    final_price = ml_price
-    if analogs:
-        prices = []
-        for a in analogs:
-            p = a.get("price")
-            if p is None:
-                continue
-            p = float(p)
-            if deal_type == 'rent' and 8000 <= p <= 500000:
-                prices.append(p)
-            if deal_type == 'sale' and 1000000 <= p <= 50000000:
-                prices.append(p)
-
-        prices = filter_outliers_iqr(prices)
-        if prices:
-            cian_med = float(np.median(prices))
-            w_ml, w_analog = (0.3, 0.7) if deal_type == 'rent' else (0.2, 0.8)
-            final_price = ml_price * w_ml + cian_med * w_analog
-
-    return float(final_price), float(ml_price), analogs
\ No newline at end of file
+    for search_key, idx in by_search.items():
+        # Поиски идут параллельно, поэтому общий дедлайн ограничивает и суммарное ожидание
+        market_price, analogs, status = await await_market_reference(market_tasks[search_key], *search_key, deadline)
+        if status != 'ok':
+            cancel_queued()
+        for i in idx:
+            count_analogs_status(status)
+            final_price = blend_price(ml_prices[i], market_price, search_key[1])
+            results[i] = (float(final_price), float(ml_prices[i]), analogs, status)
+            if market_price is not None and status == 'ok':
+                prediction_cache.set_blend(blend_keys[i], results[i])
+    return results
@@ -1,4 +1,3 @@
-import joblib
 import pandas as pd
 import numpy as np
 from catboost import CatBoostRegressor
@@ -6,6 +5,8 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import warnings
 
+from core.services.model_registry import save_model_artifact
+
 warnings.filterwarnings('ignore')
 
 # Загрузка данных
@@ -119,8 +120,8 @@ def train_model():
     print(f"R²: {r2:.4f}")
 
     # Сохранение модели
-    joblib.dump({'model': model}, 'models/rent_model.joblib')
-    print("Модель аренды сохранена")
+    path = save_model_artifact(model, 'rent')
+    print(f"Модель аренды сохранена: {path}")
 
     return model
 
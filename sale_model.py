@@ -1,4 +1,3 @@
-import joblib
 import pandas as pd
 import numpy as np
 from catboost import CatBoostRegressor
@@ -6,6 +5,8 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score, mean_absolute_percentage_error
 import warnings
 
+from core.services.model_registry import save_model_artifact
+
 warnings.filterwarnings('ignore')
 
 
@@ -146,8 +147,8 @@ def train_model():
     print(f"Отношение MAE к средней цене: {mae / y_test_orig.mean():.3f}")
 
     # Сохранение модели
-    joblib.dump({'model': model}, 'models/sale_model.joblib')
-    print("Модель продажи сохранена")
+    path = save_model_artifact(model, 'sale')
+    print(f"Модель продажи сохранена: {path}")
 
     return model
 
@@ -1,3 +1,5 @@
+import asyncio
+import os
 from pathlib import Path
 from fastapi import FastAPI, Depends
 import uvicorn
@@ -5,22 +7,61 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from web.api.routers import locations, predict, health
-from core.services.city_region_mapper import CityRegionMapper
+from web.api.routers import locations, predict, health, metrics
+from core.services.city_region_mapper import city_regions
 from core.services.model_registry import ModelRegistry
 
 from contextlib import asynccontextmanager
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from core.db.session import engine, get_db
+from core.parsers.cian_locations import cian_locations
+from core.parsers.http_client import close_http_client
+from core.services.redis_client import close_redis
+from core.services.executor import compute_executor
+from core.services.metrics import RequestTimingMiddleware
+from core.services.prediction_cache import prediction_cache
+from core.services.valuation_log import valuation_writer
 
 BASE_DIR = Path(__file__).resolve().parents[2]  # корень проекта (AxiomlyAPI)
+MODELS_DIR = os.getenv("MODELS_DIR", str(BASE_DIR / "models"))
+
+async def on_models_swapped(swapped):
+    """Новая версия модели: переключаем процессы-воркеры и сбрасываем кэш прогнозов"""
+    await asyncio.to_thread(compute_executor.activate, swapped)
+    # Кэш прогнозов не потокобезопасен: сбрасываем его в цикле событий
+    prediction_cache.invalidate(swapped)
+
+def startup(app: FastAPI):
+    print("\n=== Запуск AxiomlyAPI ===")
+    app.state.city_regions = city_regions
+    print(f"Загружено регионов: {len(city_regions.current.region_to_cities)}")
+    # С пулом процессов модели держат воркеры; родитель проверяет артефакты и хранит версии
+    app.state.models = ModelRegistry.load_from_disk(
+        MODELS_DIR, versions_only=compute_executor.mode == "process"
+    )
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup - ничего не делаем пока
+    # Startup. При заданном lifespan обработчики on_event("startup") не вызываются
+    startup(app)
+    await asyncio.to_thread(compute_executor.start, MODELS_DIR)
+    city_regions.start_watching()
+    # Индекс локаций CIAN читается до первых запросов, обновляется из библиотеки в фоне
+    await asyncio.to_thread(len, cian_locations)
+    cian_locations.start_watching()
+    app.state.models.start_watching(on_swap=on_models_swapped)
+    valuation_writer.start()
     yield
-    # Shutdown - закрываем пул соединений
+    # Shutdown - закрываем пулы соединений
+    await app.state.models.stop_watching()
+    await city_regions.stop_watching()
+    await cian_locations.stop_watching()
+    # Дописываем журнал оценок до закрытия пула соединений БД
+    await valuation_writer.stop()
+    await close_http_client()
+    compute_executor.shutdown()
+    await close_redis()
     await engine.dispose()
 app = FastAPI(title="AxiomlyAPI", lifespan=lifespan)
 
@@ -36,17 +77,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"]
 )
-
-@app.on_event("startup")
-def startup():
-    print("\n=== Запуск AxiomlyAPI ===")
-    app.state.city_mapper = CityRegionMapper(str(BASE_DIR / "config" / "regions.json"))
-    print(f"Загружено регионов: {len(app.state.city_mapper.region_to_cities)}")
-    app.state.models = ModelRegistry.load_from_disk(str(BASE_DIR / "models"))
+app.add_middleware(RequestTimingMiddleware)
 
 app.include_router(locations.router, prefix="/api", tags=["Locations"])
 app.include_router(predict.router, prefix="/api", tags=["Predict"])
 app.include_router(health.router, prefix="/api", tags=["Health"])
+app.include_router(metrics.router, tags=["Metrics"])
 
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "web" / "static")), name="static")
 
@@ -1,5 +1,13 @@
 from fastapi import APIRouter, Request
 
+from core.parsers.analogs_provider import sources_stats
+from core.services.analog_cache import analog_cache
+from core.services.cian_guard import cian_guard
+from core.services.executor import compute_executor
+from core.services.listing_store import listing_store
+from core.services.prediction_cache import prediction_cache
+from core.services.valuation_log import valuation_writer
+
 router = APIRouter()
 
 
@@ -7,12 +15,21 @@ router = APIRouter()
 def health(request: Request):
     """Проверка работоспособности"""
     models = request.app.state.models
-    city_mapper = request.app.state.city_mapper
+    regions = request.app.state.city_regions.stats()
 
     return {
         'status': 'ok',
         'sale_model_loaded': 'sale' in models.models,
         'rent_model_loaded': 'rent' in models.models,
-        'regions_count': len(city_mapper.region_to_cities),
+        'model_versions': models.versions(),
+        'regions_count': regions['regions_count'],
+        'regions_version': regions['version'],
+        'analog_cache': analog_cache.stats(),
+        'analog_sources': sources_stats(),
+        'cian_guard': cian_guard.stats(),
+        'prediction_cache': prediction_cache.stats(),
+        'listing_store': listing_store.stats(),
+        'valuation_log': valuation_writer.stats(),
+        'executor': compute_executor.stats(),
         'message': 'Сервер работает'
     }
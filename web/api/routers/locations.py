@@ -1,60 +1,52 @@
-from fastapi import APIRouter, Request, Query
+import asyncio
+import hmac
+import os
+
+from fastapi import APIRouter, Header, HTTPException, Request, Query, Response
 
 router = APIRouter()
 
+# Токен для служебных эндпоинтов; без него перезагрузка по запросу выключена
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
 
 @router.get("/locations")
 def get_locations(request: Request):
     """Получение всех локаций"""
-    city_mapper = request.app.state.city_mapper
-    locations = []
-
-    for region, cities in city_mapper.region_to_cities.items():
-        locations.append({
-            'type': 'region',
-            'name': region,
-            'value': region
-        })
-        for city in cities:
-            locations.append({
-                'type': 'city',
-                'name': city,
-                'value': city,
-                'region': region,
-                'parent': region
-            })
-
-    return locations
+    # Тело собрано заранее при загрузке справочника, здесь только выбор варианта
+    payload = request.app.state.city_regions.current.locations_payload
+    encoded = payload.get_encoded(request.headers.get('accept-encoding', ''))
+    coding, body = encoded if encoded is not None else (None, payload.body)
+    headers = {
+        'ETag': payload.etag_for(coding),
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding',
+    }
+
+    if payload.matches(request.headers.get('if-none-match', '')):
+        return Response(status_code=304, headers=headers)
+
+    if coding is not None:
+        headers['Content-Encoding'] = coding
+    return Response(content=body, media_type='application/json', headers=headers)
 
 
 @router.get("/search-locations")
 def search_locations(request: Request, q: str = Query("")):
     """Поиск локаций по названию"""
-    query = q.lower().strip()
-    if not query:
-        return []
-
-    city_mapper = request.app.state.city_mapper
-    results = []
-
-    for region, cities in city_mapper.region_to_cities.items():
-        if query in region.lower():
-            results.append({
-                'type': 'region',
-                'name': region,
-                'value': region
-            })
-
-        for city in cities:
-            if query in city.lower():
-                results.append({
-                    'type': 'city',
-                    'name': city,
-                    'value': city,
-                    'region': region,
-                    'parent': region
-                })
-
-    # Сортировка
-    results.sort(key=lambda x: (0 if x['name'].lower().startswith(query) else 1, x['name'].lower()))
-    return results[:20]
+    return request.app.state.city_regions.current.search(q, limit=20)
+
+
+@router.post("/locations/reload")
+async def reload_locations(request: Request, x_admin_token: str = Header("")):
+    """Перечитать справочник регионов без перезапуска сервиса"""
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(403, "Доступ запрещен")
+
+    city_regions = request.app.state.city_regions
+    try:
+        changed = await asyncio.to_thread(city_regions.reload, True)
+    except Exception as e:
+        raise HTTPException(500, f"Справочник не перезагружен: {e}")
+
+    return {'success': changed, **city_regions.stats()}
@@ -1,23 +1,26 @@
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
 from fastapi import APIRouter, Request, HTTPException
-from web.api.schemas import PredictRequest, PredictResponse
-from predict_price import predict_with_analogs
+from web.api.schemas import (
+    PredictRequest, PredictResponse, BatchPredictRequest, BatchPredictResponse
+)
+from predict_price import PREDICT_BATCH_DEADLINE, PREDICT_DEADLINE, predict_with_analogs, predict_batch_with_analogs
+from core.services.metrics import observe_stage, stage_timer
+from core.services.valuation_log import valuation_writer
 
 router = APIRouter()
 
+ANALOGS_MESSAGES = {
+    'ok': 'Прогноз выполнен',
+    'stale': 'Прогноз выполнен, аналоги из кэша: источник не ответил вовремя',
+    'skipped': 'Прогноз выполнен без аналогов: источник не ответил вовремя',
+}
 
-@router.post("/predict", response_model=PredictResponse)
-def predict(req: PredictRequest, request: Request):
-    """Прогноз цены с аналогами"""
-    models = request.app.state.models
-    city_mapper = request.app.state.city_mapper
-
-    # Получаем модель
-    model = models.get(req.deal_type)
-    if model is None:
-        raise HTTPException(400, f"Модель {req.deal_type} не загружена")
 
-    # Определяем город/регион
-    location = req.location.strip()
+def resolve_location(location: str, city_mapper) -> Tuple[str, str]:
+    """Определяет (город, регион) по введенной локации"""
+    location = location.strip()
     if location in city_mapper.region_to_cities:
         region = location
         cities = city_mapper.get_cities_by_region(region)
@@ -29,9 +32,11 @@ def predict(req: PredictRequest, request: Request):
         region = city_mapper.get_region_from_city(city)
         if region == "Неизвестный регион":
             raise HTTPException(400, f"Город {city} не найден")
+    return city, region
 
-    # Подготовка данных
-    input_data = {
+
+def build_input_data(req: PredictRequest, city: str, region: str) -> Dict[str, Any]:
+    return {
         'region': region,
         'city': city,
         'building_type': req.building_type,
@@ -44,14 +49,16 @@ def predict(req: PredictRequest, request: Request):
         'deal_type': req.deal_type
     }
 
-    try:
-        final_price, ml_price, analogs = predict_with_analogs(
-            input_data=input_data, deal_type=req.deal_type, model=model
-        )
-    except Exception as e:
-        raise HTTPException(500, str(e))
 
-    # Форматируем ответ
+def format_response(
+    req: PredictRequest,
+    region: str,
+    city: str,
+    final_price: float,
+    ml_price: float,
+    analogs: List[Dict[str, Any]],
+    analogs_status: str = 'ok'
+) -> Dict[str, Any]:
     is_rent = req.deal_type == 'rent'
     price_suffix = "руб./мес" if is_rent else "руб."
 
@@ -81,5 +88,119 @@ def predict(req: PredictRequest, request: Request):
         'rooms': req.rooms,
         'analogs_count': len(analogs),
         'analogs': analogs_formatted,
-        'message': 'Прогноз выполнен'
+        'analogs_status': analogs_status,
+        'message': ANALOGS_MESSAGES[analogs_status]
+    }
+
+
+def observe_validation(request: Request) -> None:
+    """Время от начала запроса до обработчика: чтение тела и валидация pydantic"""
+    started_at = getattr(request.state, 'started_at', None)
+    if started_at is not None:
+        observe_stage('validation', time.perf_counter() - started_at)
+
+
+def request_deadline(request: Request, budget: float = PREDICT_DEADLINE) -> Optional[float]:
+    """Дедлайн запроса по time.perf_counter, отсчитанный от его начала"""
+    if budget <= 0:
+        return None
+    return getattr(request.state, 'started_at', time.perf_counter()) + budget
+
+
+def record_valuation(req: PredictRequest, response: Dict[str, Any], model) -> None:
+    """Запись оценки в журнал (в фоне, ответ не ждет БД)"""
+    valuation_writer.record(
+        payload=req.model_dump(),
+        price=response['price'],
+        details={
+            'city': response['city'],
+            'region': response['region'],
+            'ml_price': response['ml_price'],
+            'analogs_count': response['analogs_count'],
+            'analogs_status': response['analogs_status'],
+            'model_version': getattr(model, 'version', None),
+        },
+    )
+
+
+@router.post("/predict", response_model=PredictResponse)
+async def predict(req: PredictRequest, request: Request):
+    """Прогноз цены с аналогами"""
+    observe_validation(request)
+    models = request.app.state.models
+    city_mapper = request.app.state.city_regions.current
+
+    # Получаем модель
+    model = models.get(req.deal_type)
+    if model is None:
+        raise HTTPException(400, f"Модель {req.deal_type} не загружена")
+
+    # Определяем город/регион
+    city, region = resolve_location(req.location, city_mapper)
+
+    # Подготовка данных
+    input_data = build_input_data(req, city, region)
+
+    try:
+        final_price, ml_price, analogs, analogs_status = await predict_with_analogs(
+            input_data=input_data, deal_type=req.deal_type, model=model, deadline=request_deadline(request)
+        )
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+    # Форматируем ответ
+    with stage_timer('response_format'):
+        response = format_response(req, region, city, final_price, ml_price, analogs, analogs_status)
+    record_valuation(req, response, model)
+    return response
+
+
+@router.post("/predict/batch", response_model=BatchPredictResponse)
+async def predict_batch(batch: BatchPredictRequest, request: Request):
+    """Пакетный прогноз цен: ошибки отдельных объектов не прерывают пакет"""
+    models = request.app.state.models
+    city_mapper = request.app.state.city_regions.current
+
+    results: List[Dict[str, Any]] = [None] * len(batch.items)
+    valid: List[Tuple[int, PredictRequest, str, str]] = []
+    loaded_models: Dict[str, Any] = {}
+
+    for i, req in enumerate(batch.items):
+        model = loaded_models.get(req.deal_type) or models.get(req.deal_type)
+        if model is None:
+            results[i] = {'index': i, 'success': False, 'error': f"Модель {req.deal_type} не загружена"}
+            continue
+        try:
+            city, region = resolve_location(req.location, city_mapper)
+        except HTTPException as e:
+            results[i] = {'index': i, 'success': False, 'error': e.detail}
+            continue
+        loaded_models[req.deal_type] = model
+        valid.append((i, req, city, region))
+
+    if valid:
+        try:
+            predictions = await predict_batch_with_analogs(
+                [build_input_data(req, city, region) for _, req, city, region in valid],
+                loaded_models,
+                deadline=request_deadline(request, PREDICT_BATCH_DEADLINE),
+            )
+        except Exception as e:
+            raise HTTPException(500, str(e))
+
+        for (i, req, city, region), (final_price, ml_price, analogs, analogs_status) in zip(valid, predictions):
+            response = format_response(req, region, city, final_price, ml_price, analogs, analogs_status)
+            record_valuation(req, response, loaded_models[req.deal_type])
+            results[i] = {
+                'index': i,
+                'success': True,
+                'result': response,
+            }
+
+    failed = sum(1 for r in results if not r['success'])
+    return {
+        'success': failed == 0,
+        'count': len(results),
+        'failed': failed,
+        'results': results,
     }
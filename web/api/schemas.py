@@ -35,4 +35,21 @@ class PredictResponse(BaseModel):
     rooms: int
     analogs_count: int
     analogs: List[AnalogResponse]
+    # ok — свежие аналоги, stale — из устаревшего кэша, skipped — не успели к дедлайну
+    analogs_status: str = 'ok'
     message: str
+
+class BatchPredictRequest(BaseModel):
+    items: List[PredictRequest] = Field(min_length=1, max_length=5000)
+
+class BatchPredictItem(BaseModel):
+    index: int
+    success: bool
+    result: Optional[PredictResponse] = None
+    error: Optional[str] = None
+
+class BatchPredictResponse(BaseModel):
+    success: bool
+    count: int
+    failed: int
+    results: List[BatchPredictItem]